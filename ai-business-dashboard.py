@@ -1,38 +1,23 @@
 import streamlit as st
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 import pandas as pd
-import yfinance as yf
-import matplotlib.patches as mpatches
 from datetime import datetime, timedelta
 import time
-import matplotlib as mpl
-import platform
 import os
-import japanize_matplotlib
-
-# 日本語フォントの設定（プラットフォームに応じて適切なフォントを設定）
-def setup_japanese_fonts():
-    try:
-        # システムごとのフォント設定
-        os_name = platform.system()
-        if os_name == 'Windows':
-            plt.rcParams['font.family'] = "MS Gothic"
-        elif os_name == 'Darwin':  # Mac OS
-            plt.rcParams['font.family'] = "Hiragino Sans GB"
-        else:  # Linux その他
-            plt.rcParams['font.family'] = "IPAGothic"
-        
-        # マイナス記号を正しく表示
-        mpl.rcParams['axes.unicode_minus'] = False
-        return True
-    except Exception as e:
-        st.warning(f"日本語フォント設定中にエラーが発生しました: {e}")
-        return False
-
-# 日本語フォントを設定
-setup_japanese_fonts()
+from analytics import EVENT_DRAWDOWN_WINDOW, event_study, event_study_by_category, period_performance
+from annotations import ADMINISTRATIONS_PATH, EVENTS_PATH, AdministrationTable, CatalogFile, EventTable
+from indicators import INDICATORS, IndicatorEngine, build_overlays
+from instrumentation import RunTimer, create_metrics
+from market_data import (
+    COMPARISON_TICKERS, PriceStore, TickerCache, align_to_calendar, data_version, load_provider,
+    normalize_to_base, slice_range,
+)
+from chart_renderer import build_chart_spec, render_chart
+from downsample import DEFAULT_MAX_POINTS
+from exports import EXPORT_FORMATS, ExportCache, build_export_frame, indicator_columns, write_export
+from interactive_chart import OVERVIEW_POINTS, WINDOW_PARAM, build_detail_chart, build_overview_chart, selected_window
+from render_cache import RenderCache
+from render_pool import create_render_pool
 
 # ページ設定
 st.set_page_config(
@@ -41,6 +26,13 @@ st.set_page_config(
     layout="wide"
 )
 
+# 再実行の各段階の処理時間とキャッシュのヒット数の計測（プロセス全体で共有）
+@st.cache_resource
+def get_metrics():
+    return create_metrics()
+
+timer = RunTimer(get_metrics())
+
 # タイトルとイントロダクション
 st.title("S&P500と政権変化・重要イベントの可視化")
 st.markdown("""
@@ -54,100 +46,61 @@ st.sidebar.header("パラメータ設定")
 # 日付範囲の選択
 start_year = st.sidebar.slider("開始年", 1990, 2024, 2000)
 start_date = f"{start_year}-01-01"
-today = datetime.now().strftime("%Y-%m-%d")
+
+# 比較する指数・ETF（S&P500と合わせて開始日=100に指数化して表示）
+comparison_tickers = st.sidebar.multiselect(
+    "比較する指数・ETF",
+    options=list(COMPARISON_TICKERS),
+    format_func=lambda ticker: f"{COMPARISON_TICKERS[ticker]} ({ticker})",
+)
 
 # ローディングメッセージ
-with st.spinner("S&P500のデータをダウンロード中..."):
-    # データのキャッシュ機能
-    @st.cache_data(ttl=3600)  # 1時間キャッシュ
-    def load_sp500_data(start_date):
-        try:
-            sp500 = yf.download('^GSPC', start=start_date)
-            return sp500
-        except Exception as e:
-            st.error(f"データのダウンロード中にエラーが発生しました: {e}")
-            return None
-
-    # データ取得
-    sp500 = load_sp500_data(start_date)
+with st.spinner("S&P500のデータをダウンロード中..."), timer.stage("data_load"):
+    # ローカル保存（Parquet）付きの価格ストア（プロセス全体で共有）
+    @st.cache_resource
+    def get_price_store():
+        return PriceStore(load_provider())
+
+    # 価格データのキャッシュ（全履歴をティッカーごとにプロセス全体で1つだけ保持する読み取り専用の共有オブジェクト）
+    # 1時間ごとにバックグラウンドのスレッドで差分を取得し、更新中も各セッションには直前のデータをすぐに返す
+    # スピナーが表示されるのは、保存済みのデータがないティッカーを初めて取得するときだけ
+    @st.cache_resource
+    def get_ticker_cache():
+        return TickerCache(get_price_store(), ttl=3600).start()
+
+    ticker_cache = get_ticker_cache()
+    frames, errors = ticker_cache.get_many(['^GSPC'] + comparison_tickers)
+
+    # データ取得（全履歴から開始年以降をビューとして切り出す）
+    sp500_full = frames.get('^GSPC')
+    if '^GSPC' in errors:
+        if sp500_full is None:
+            st.error(f"データのダウンロード中にエラーが発生しました: {errors['^GSPC']}")
+        else:
+            # 差分の取得に失敗した場合は保存済みのデータを使用
+            st.warning(f"最新データの取得に失敗したため、保存済みのデータを表示しています: {errors['^GSPC']}")
+    sp500 = slice_range(sp500_full, start_date) if sp500_full is not None else None
+
+    # 比較ティッカーのデータ
+    comparison_frames = {ticker: frames[ticker] for ticker in comparison_tickers if ticker in frames}
+    for ticker in comparison_tickers:
+        if ticker in errors:
+            st.warning(f"{ticker} のデータ取得中にエラーが発生しました: {errors[ticker]}")
 
 if sp500 is not None and not sp500.empty:
-    # 政権の期間を定義
-    presidents = [
-        {"name": "ブッシュ（父）", "start": "1989-01-20", "end": "1993-01-20", "color": "lightcoral", "party": "共和党"},
-        {"name": "クリントン", "start": "1993-01-20", "end": "2001-01-20", "color": "lightblue", "party": "民主党"},
-        {"name": "ブッシュ（子）", "start": "2001-01-20", "end": "2009-01-20", "color": "lightcoral", "party": "共和党"},
-        {"name": "オバマ", "start": "2009-01-20", "end": "2017-01-20", "color": "lightblue", "party": "民主党"},
-        {"name": "トランプ", "start": "2017-01-20", "end": "2021-01-20", "color": "lightcoral", "party": "共和党"},
-        {"name": "バイデン", "start": "2021-01-20", "end": "2025-01-20", "color": "lightblue", "party": "民主党"},
-        {"name": "トランプ", "start": "2025-01-20", "end": today, "color": "lightcoral", "party": "共和党"}
-    ]
-
-    # 重要なイベントを定義（より多くの正確なイベント）
-    all_events = [
-        # 2000年代
-        {"date": "2000-03-10", "name": "ドットコムバブル崩壊", "color": "darkred", "category": "金融危機"},
-        {"date": "2001-09-11", "name": "9.11テロ事件", "color": "red", "category": "地政学的事件"},
-        {"date": "2002-07-30", "name": "サーベンス・オクスリー法成立", "color": "blue", "category": "金融規制"},
-        {"date": "2003-03-20", "name": "イラク戦争開始", "color": "orange", "category": "地政学的事件"},
-        {"date": "2004-05-10", "name": "原油価格40ドル突破", "color": "brown", "category": "コモディティ"},
-        {"date": "2005-08-29", "name": "ハリケーン・カトリーナ", "color": "teal", "category": "自然災害"},
-        {"date": "2006-02-01", "name": "バーナンキFRB議長就任", "color": "purple", "category": "金融政策"},
-        {"date": "2007-02-27", "name": "上海ショック", "color": "darkred", "category": "金融危機"},
-        {"date": "2007-08-09", "name": "サブプライム危機表面化", "color": "darkred", "category": "金融危機"},
-        {"date": "2008-03-16", "name": "ベアー・スターンズ破綻", "color": "darkred", "category": "金融危機"},
-        {"date": "2008-09-15", "name": "リーマン・ブラザーズ破綻", "color": "darkred", "category": "金融危機"},
-        {"date": "2008-10-03", "name": "TARP法成立", "color": "blue", "category": "金融政策"},
-        {"date": "2008-11-25", "name": "QE1開始", "color": "purple", "category": "金融政策"},
-        {"date": "2009-03-09", "name": "金融危機最安値", "color": "green", "category": "金融危機"},
-        
-        # 2010年代前半
-        {"date": "2010-05-06", "name": "フラッシュクラッシュ", "color": "darkred", "category": "金融危機"},
-        {"date": "2010-05-09", "name": "欧州金融安定化基金設立", "color": "blue", "category": "金融政策"},
-        {"date": "2010-11-03", "name": "QE2開始", "color": "purple", "category": "金融政策"},
-        {"date": "2011-03-11", "name": "東日本大震災", "color": "teal", "category": "自然災害"},
-        {"date": "2011-08-05", "name": "米国債格下げ（S&P）", "color": "brown", "category": "金融危機"},
-        {"date": "2011-08-11", "name": "短期売り規制導入", "color": "blue", "category": "金融規制"},
-        {"date": "2012-07-26", "name": "ドラギ「何でもする」演説", "color": "purple", "category": "金融政策"},
-        {"date": "2012-09-13", "name": "QE3開始", "color": "purple", "category": "金融政策"},
-        {"date": "2013-05-22", "name": "バーナンキ・テーパリング示唆", "color": "purple", "category": "金融政策"},
-        {"date": "2014-10-29", "name": "QE3終了", "color": "purple", "category": "金融政策"},
-        
-        # 2010年代後半
-        {"date": "2015-08-11", "name": "中国人民元切り下げ", "color": "red", "category": "金融危機"},
-        {"date": "2015-12-16", "name": "FRB利上げ開始", "color": "purple", "category": "金融政策"},
-        {"date": "2016-06-23", "name": "英国EU離脱投票", "color": "orange", "category": "地政学的事件"},
-        {"date": "2016-11-08", "name": "トランプ大統領選出", "color": "orange", "category": "地政学的事件"},
-        {"date": "2017-01-25", "name": "ダウ20000ドル突破", "color": "green", "category": "市場マイルストーン"},
-        {"date": "2018-01-26", "name": "ダウ26616ドル最高値", "color": "green", "category": "市場マイルストーン"},
-        {"date": "2018-02-05", "name": "ボラティリティショック", "color": "darkred", "category": "金融危機"},
-        {"date": "2018-03-22", "name": "米中貿易戦争開始", "color": "orange", "category": "地政学的事件"},
-        {"date": "2018-12-22", "name": "米政府機関閉鎖", "color": "red", "category": "地政学的事件"},
-        {"date": "2019-07-31", "name": "FRB利下げ開始", "color": "purple", "category": "金融政策"},
-        {"date": "2019-09-17", "name": "レポ市場危機", "color": "darkred", "category": "金融危機"},
-        
-        # 2020年代
-        {"date": "2020-02-19", "name": "コロナ前最高値", "color": "green", "category": "市場マイルストーン"},
-        {"date": "2020-03-11", "name": "WHOがCOVID-19のパンデミック宣言", "color": "red", "category": "健康危機"},
-        {"date": "2020-03-15", "name": "FRBゼロ金利復帰・無制限QE", "color": "purple", "category": "金融政策"},
-        {"date": "2020-03-23", "name": "コロナショック最安値", "color": "darkred", "category": "金融危機"},
-        {"date": "2020-03-27", "name": "CARES法成立", "color": "blue", "category": "金融政策"},
-        {"date": "2021-01-06", "name": "米国議会議事堂襲撃", "color": "red", "category": "地政学的事件"},
-        {"date": "2021-11-08", "name": "S&P500最高値（当時）", "color": "green", "category": "市場マイルストーン"},
-        {"date": "2022-02-24", "name": "ロシアのウクライナ侵攻", "color": "orange", "category": "地政学的事件"},
-        {"date": "2022-03-16", "name": "FRB利上げ開始", "color": "purple", "category": "金融政策"},
-        {"date": "2022-06-13", "name": "ベア市場入り宣言", "color": "darkred", "category": "金融危機"},
-        {"date": "2022-09-28", "name": "英国債市場危機", "color": "darkred", "category": "金融危機"},
-        {"date": "2023-03-10", "name": "シリコンバレー銀行の破綻", "color": "darkred", "category": "金融危機"},
-        {"date": "2023-05-01", "name": "米地域銀行危機", "color": "darkred", "category": "金融危機"},
-        {"date": "2023-07-31", "name": "日銀YCC政策修正", "color": "purple", "category": "金融政策"},
-        {"date": "2023-12-13", "name": "FRBピボット示唆", "color": "purple", "category": "金融政策"},
-        {"date": "2024-01-19", "name": "S&P500最高値更新", "color": "green", "category": "市場マイルストーン"},
-        {"date": "2024-03-20", "name": "FRB金利据え置き継続", "color": "purple", "category": "金融政策"}
-    ]
+    # 外部ファイルのイベント・政権カタログ（プロセス全体で一度だけ読み込み、ファイルが更新されたときだけ読み直す）
+    @st.cache_resource
+    def get_catalog_files():
+        return CatalogFile(EVENTS_PATH, EventTable), CatalogFile(ADMINISTRATIONS_PATH, AdministrationTable)
+
+    # 日付をdatetime64配列に変換して日付順に保持したイベント・政権のテーブル
+    with timer.stage("catalog"):
+        event_file, president_file = get_catalog_files()
+        event_table = event_file.get()
+        president_table = president_file.get()
 
     # イベントカテゴリ選択
-    event_categories = list(set(event["category"] for event in all_events))
+    event_categories = event_table.unique_categories()
     # カテゴリを特定の順序で並べる
     ordered_categories = ["金融危機", "金融政策", "金融規制", "地政学的事件", "健康危機", "自然災害", "コモディティ", "市場マイルストーン"]
     # リストの順序を保ちながら、ordered_categoriesに含まれる要素だけをフィルタリング
@@ -156,320 +109,370 @@ if sp500 is not None and not sp500.empty:
     sorted_categories.extend([category for category in event_categories if category not in ordered_categories])
     
     # イベント数の制限オプション
-    max_events = st.sidebar.slider("表示するイベントの最大数", 5, len(all_events), min(20, len(all_events)))
+    # イベントが5件以下のカタログではスライダーの範囲が作れないため、すべてのイベントを表示する
+    if len(event_table) > 5:
+        max_events = st.sidebar.slider("表示するイベントの最大数", 5, len(event_table), max(5, min(20, len(event_table))))
+    else:
+        max_events = 5
     
     selected_categories = st.sidebar.multiselect(
         "表示するイベントカテゴリ",
         options=sorted_categories,
-        default=["金融危機", "金融政策", "地政学的事件"] if "金融危機" in sorted_categories else sorted_categories[:3]
+        # 既定のカテゴリのうちカタログに含まれるもの（1つもない場合は先頭の3つ）
+        default=[category for category in ["金融危機", "金融政策", "地政学的事件"] if category in sorted_categories]
+        or sorted_categories[:3]
     )
 
-    # 選択されたカテゴリに基づいてイベントをフィルタリングし、日付でソート
-    filtered_events = [event for event in all_events if event["category"] in selected_categories]
-    # 日付でソート
-    filtered_events.sort(key=lambda x: pd.to_datetime(x["date"]))
-    
-    # データの表示範囲に該当するイベントのみに絞り込む
-    in_range_events = []
-    for event in filtered_events:
-        event_date = pd.to_datetime(event["date"])
-        if event_date >= sp500.index[0] and event_date <= sp500.index[-1]:
-            in_range_events.append(event)
-    
-    # 最大数に制限
-    events = in_range_events[:max_events]
+    # 選択されたカテゴリのうち、データの表示範囲に該当するイベントを日付順に最大数まで取り出す
+    with timer.stage("event_filter"):
+        events = event_table.select(selected_categories, sp500.index[0], sp500.index[-1], limit=max_events)
 
     # 政権表示のオプション
     show_presidents = st.sidebar.checkbox("政権の期間を表示", value=True)
     
-    # グラフのスタイル設定
-    graph_style = st.sidebar.selectbox(
-        "グラフスタイル",
-        ["デフォルト", "ダークテーマ", "ミニマル", "科学論文風"]
-    )
+    # テクニカル指標の計算結果のキャッシュ（全セッションで共有し、データ追記時は末尾だけ再計算）
+    @st.cache_resource
+    def get_indicator_engine():
+        return IndicatorEngine()
 
-    # マーケット指標の追加オプション
-    show_volume = st.sidebar.checkbox("出来高を表示", value=False)
-    show_ma = st.sidebar.checkbox("移動平均線を表示", value=False)
-    
-    if show_ma:
-        ma_period = st.sidebar.slider("移動平均の期間（日数）", 5, 200, 50)
-
-    # プロット生成関数
-    def generate_plot():
-        # matplotlibスタイルの修正（バージョン間の互換性のためにtry-exceptで囲む）
-        try:
-            if graph_style == "ダークテーマ":
-                plt.style.use('dark_background')
-            elif graph_style == "科学論文風":
-                # 新旧バージョン両方に対応
-                try:
-                    plt.style.use('seaborn-whitegrid')
-                except:
-                    plt.style.use('seaborn-v0_8-whitegrid')
-            elif graph_style == "ミニマル":
-                try:
-                    plt.style.use('seaborn-minimal')
-                except:
-                    try:
-                        plt.style.use('seaborn-v0_8-white')
-                    except:
-                        plt.style.use('default')
-            else:
-                plt.style.use('default')
-        except Exception as e:
-            st.warning(f"グラフスタイルの適用中にエラーが発生しました: {e}")
-            plt.style.use('default')
+    # 描画済みグラフのキャッシュ（全セッションで共有し、合計サイズの上限でLRU破棄）
+    @st.cache_resource
+    def get_render_cache():
+        return RenderCache(max_bytes=int(os.environ.get("RENDER_CACHE_MAX_BYTES", 64 * 1024 * 1024)))
 
-        fig, ax = plt.subplots(figsize=(12, 8))
+    # 別プロセスでグラフを描画するプール（環境変数 RENDER_WORKERS でワーカー数を指定、未指定時は使わない）
+    @st.cache_resource
+    def get_render_pool():
+        return create_render_pool()
 
-        # メインプロット（S&P500の終値）
-        ax.plot(sp500.index, sp500['Close'], color='black' if graph_style != "ダークテーマ" else 'white', 
-                linewidth=1.5, label='S&P500終値')
-        
-        # 移動平均線を追加
-        if show_ma:
-            ma = sp500['Close'].rolling(window=ma_period).mean()
-            ax.plot(sp500.index, ma, color='red', linewidth=1.2, 
-                    label=f'{ma_period}日移動平均')
-
-        # 出来高をサブプロットとして追加
-        if show_volume:
-            # メインのaxesのサイズを調整して下部に出来高のスペースを確保
-            ax.set_position([0.1, 0.3, 0.8, 0.6])  # [left, bottom, width, height]
-            
-            # 出来高用のaxesを作成
-            ax_volume = fig.add_axes([0.1, 0.1, 0.8, 0.15])  # [left, bottom, width, height]
-            ax_volume.bar(sp500.index, sp500['Volume'], color='gray', alpha=0.5)
-            ax_volume.set_ylabel('出来高', fontsize=10)
-            ax_volume.tick_params(axis='x', labelsize=8)
-            ax_volume.tick_params(axis='y', labelsize=8)
-            
-            # x軸の日付フォーマットを設定
-            ax_volume.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-            ax_volume.xaxis.set_major_locator(mdates.YearLocator(2))  # 2年ごとにメモリを設定
-            plt.setp(ax_volume.get_xticklabels(), rotation=45)
+    # ダウンロード用に書き出したファイルのキャッシュ（全セッションで共有）
+    @st.cache_resource
+    def get_export_cache():
+        return ExportCache()
 
-        # 政権の背景色を設定と大統領名の表示
-        if show_presidents:
-            for president in presidents:
-                start_date_p = pd.to_datetime(president["start"])
-                end_date_p = pd.to_datetime(president["end"])
-                
-                # データの範囲内にある場合のみプロット
-                if end_date_p >= sp500.index[0] and start_date_p <= sp500.index[-1]:
-                    # データの日付範囲に合わせて調整
-                    actual_start = max(start_date_p, sp500.index[0])
-                    actual_end = min(end_date_p, sp500.index[-1])
-                    
-                    # 網掛け（背景色）を追加
-                    ax.axvspan(actual_start, actual_end, alpha=0.3, color=president["color"])
-                    
-                    # 政権名をグラフ上部に表示
-                    if actual_end > actual_start:  # 表示期間が存在する場合
-                        # 期間の中央位置を計算
-                        mid_date = actual_start + (actual_end - actual_start) / 2
-                        
-                        # y位置の調整（グラフの上部に配置）
-                        y_pos = sp500['Close'].loc[sp500.index[0]:sp500.index[-1]].max() * 1.05
-                        
-                        # 大統領名を表示
-                        ax.text(mid_date, y_pos, president["name"], 
-                                horizontalalignment='center',
-                                verticalalignment='bottom',
-                                rotation=0,
-                                fontsize=10,
-                                color='black',
-                                fontweight='bold',
-                                bbox=dict(facecolor=president["color"], alpha=0.4, pad=2, boxstyle='round,pad=0.3'))
-
-        # 重要なイベントを縦線で表示
-        for event in events:
-            event_date = pd.to_datetime(event["date"])
-            
-            # データの範囲内にある場合のみプロット
-            if event_date >= sp500.index[0] and event_date <= sp500.index[-1]:
-                ax.axvline(event_date, color=event["color"], linestyle='--', linewidth=1.5)
-                
-                # イベント名のラベルを表示（y軸の高さを調整して重ならないようにする）
-                try:
-                    # 重複を避けるため、イベントごとにy位置を調整
-                    event_index = events.index(event)
-                    # 循環的に5つの位置に分散させる（ラベルが多くなりすぎるのを防ぐ）
-                    position_index = event_index % 5
-                    y_pos = sp500['Close'].loc[sp500.index[0]:sp500.index[-1]].max() * (0.5 + position_index * 0.1)
-                    
-                    ax.text(event_date, y_pos, event["name"], rotation=90, 
-                            verticalalignment='bottom', horizontalalignment='right', 
-                            fontsize=8, color=event["color"], fontweight='bold',
-                            bbox=dict(facecolor='white', alpha=0.7, edgecolor=event["color"], 
-                                       pad=1, boxstyle='round,pad=0.2'))
-                except Exception as e:
-                    # エラーが発生した場合はスキップ（エラー解消のため）
-                    st.warning(f"イベント表示中にエラーが発生しました: {e}")
-
-        # x軸の日付フォーマットを設定
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-        ax.xaxis.set_major_locator(mdates.YearLocator(2))  # 2年ごとにメモリを設定
-        plt.xticks(rotation=45)
-
-        # グリッドの設定
-        ax.grid(True, linestyle='--', alpha=0.7)
-
-        # 凡例の作成（政権）
-        if show_presidents:
-            president_patches = []
-            shown_parties = set()  # 既に表示した政党を追跡
-            
-            for president in presidents:
-                # 政党ごとに一度だけ凡例に追加
-                if president['party'] not in shown_parties:
-                    patch = mpatches.Patch(
-                        color=president["color"], 
-                        alpha=0.3, 
-                        label=f"{president['party']}"
-                    )
-                    president_patches.append(patch)
-                    shown_parties.add(president['party'])
-            
-            # 政権凡例を追加
-            ax.legend(handles=president_patches, loc='upper left')
+    # キャッシュのヒット数などの累積値（計測の記録に含める）
+    def cache_counters():
+        render_cache, export_cache, render_pool = get_render_cache(), get_export_cache(), get_render_pool()
+        return [
+            ("cache_hits_total", {"cache": "data"}, ticker_cache.hits),
+            ("cache_misses_total", {"cache": "data"}, ticker_cache.misses),
+            ("cache_hits_total", {"cache": "render"}, render_cache.hits),
+            ("cache_misses_total", {"cache": "render"}, render_cache.misses),
+            ("cache_hits_total", {"cache": "export"}, export_cache.hits),
+            ("cache_misses_total", {"cache": "export"}, export_cache.misses),
+            ("data_refreshes_total", {}, ticker_cache.refreshes),
+            ("indicator_computes_total", {"kind": "full"}, get_indicator_engine().full_computes),
+            ("indicator_computes_total", {"kind": "tail"}, get_indicator_engine().tail_computes),
+            ("render_fallbacks_total", {}, render_pool.fallbacks if render_pool is not None else 0),
+            ("render_pool_restarts_total", {}, render_pool.restarts if render_pool is not None else 0),
+        ]
+
+    # グラフの部分（フラグメント）
+    # スタイル・出来高・指標・表示方式などグラフだけに影響する設定はこの中に置き、変更時はグラフだけを再実行する
+    # 引数はページ全体の設定で決まる値で、サイドバーの変更時はページ全体とともに再実行される
+    # フラグメントだけの再実行ではスクリプト本体は実行されず、前回の実行の timer は記録済みのため、
+    # この再実行用の計測を作って "chart" の段階と再実行全体の時間を記録する
+    @st.fragment
+    def chart_section(*args):
+        fragment_only = timer.finished
+        run_timer = RunTimer(get_metrics(), scope="fragment") if fragment_only else timer
+        with run_timer.stage("chart"):
+            chart_body(run_timer, *args)
+        if fragment_only:
+            run_timer.finish(cache_counters())
+
+    def chart_body(run_timer, sp500_full, sp500, comparison_frames, events, show_presidents, page_key):
+        with st.expander("グラフの表示設定", expanded=True):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                # グラフのスタイル設定
+                graph_style = st.selectbox("グラフスタイル", ["デフォルト", "ダークテーマ", "ミニマル", "科学論文風"])
+                # グラフの表示方式（インタラクティブの場合、拡大・移動・ツールチップはブラウザ内で処理され、サーバは再実行しない）
+                chart_mode = st.radio("グラフの表示方式", ["画像", "インタラクティブ"], horizontal=True)
+                # 描画時の間引き（既定では横幅程度の点数に間引き、全データでの描画も選択可能）
+                full_resolution = chart_mode == "画像" and st.checkbox("全データ点で描画（低速）", value=False)
+            with col2:
+                # マーケット指標の追加オプション
+                show_volume = st.checkbox("出来高を表示", value=False)
+                show_ma = st.checkbox("移動平均線を表示", value=False)
+                extra_indicators = st.multiselect(
+                    "追加のテクニカル指標",
+                    options=["EMA", "BB", "DD", "VOL"],
+                    format_func=lambda name: INDICATORS[name]["label"],
+                )
+            indicator_names = (["SMA"] if show_ma else []) + extra_indicators
+            with col3:
+                if show_ma or any(name != "DD" for name in extra_indicators):
+                    ma_period = st.slider("移動平均・指標の期間（日数）", 5, 200, 50)
+                else:
+                    ma_period = None
+
+        # 全履歴から切り出した期間 frame の描画仕様（指標と、開始日=100に指数化した比較ティッカーを含む）
+        def build_spec(frame, max_points):
+            start = sp500_full.index.searchsorted(frame.index[0])
+            overlays = build_overlays(get_indicator_engine(), indicator_names, ma_period, sp500_full,
+                                      data_version(sp500_full), start, start + len(frame))
+            # 比較ティッカーをS&P500の取引日に揃え、開始日=100に指数化する
+            normalized = normalize_to_base(align_to_calendar(comparison_frames, frame.index))
+            comparisons = [
+                {"label": COMPARISON_TICKERS.get(ticker, ticker), "values": normalized[ticker].to_numpy()}
+                for ticker in normalized.columns
+            ]
+            return build_chart_spec(frame, president_table, events, graph_style=graph_style,
+                                    show_presidents=show_presidents, show_volume=show_volume, overlays=overlays,
+                                    comparisons=comparisons, max_points=max_points)
+
+        # グラフを生成してPNGに変換（pyplotのグローバル状態を使わないため、並行するセッション間でスタイルが混ざらない）
+        def render_plot_png():
+            with run_timer.stage("chart_spec"):
+                spec = build_spec(sp500, None if full_resolution else DEFAULT_MAX_POINTS)
+            # 描画（日本語フォントの設定を含む）とPNGへの変換
+            with run_timer.stage("render"):
+                pool = get_render_pool()
+                png = pool.render(spec) if pool is not None else render_chart(spec)
+            get_metrics().observe("chart_png_bytes", len(png))
+            return png
+
+        if chart_mode == "インタラクティブ":
+            # 概観で選択された期間だけを間引いて送る（期間の長さによらず送信量は一定）
+            window = selected_window(st.session_state.get("overview_chart"))
+            detail = slice_range(sp500, *window) if window is not None else sp500
+            if len(detail) < 2:
+                detail, window = sp500, None
+            view = detail
+            with run_timer.stage("altair"):
+                st.altair_chart(build_detail_chart(build_spec(detail, DEFAULT_MAX_POINTS)), width="stretch")
+                overview_spec = build_chart_spec(sp500, president_table, events, graph_style=graph_style,
+                                                 show_presidents=False, max_points=OVERVIEW_POINTS)
+                st.altair_chart(build_overview_chart(overview_spec, window), width="stretch", key="overview_chart",
+                                on_select="rerun", selection_mode=WINDOW_PARAM)
         else:
-            ax.legend(loc='upper left')
-            
-        # y軸ラベル
-        ax.set_ylabel('S&P500終値', fontsize=12)
-        
-        # タイトル
-        plt.suptitle('S&P500と政権変化・重要イベント', fontsize=16, fontweight='bold')
-        plt.title(f'{sp500.index[0].strftime("%Y-%m-%d")} から {sp500.index[-1].strftime("%Y-%m-%d")} まで', 
-                  fontsize=12)
+            view = sp500
+            # グラフに影響するパラメータをキーにして、同じ条件のグラフは描画済みの画像を再利用する
+            chart_key = page_key + (graph_style, show_volume, tuple(indicator_names), ma_period, full_resolution)
+            chart_png = get_render_cache().get_or_render(chart_key, render_plot_png)
+            with run_timer.stage("image"):
+                st.image(chart_png, width="stretch")
+
+        # 表示中の期間のデータのダウンロード（クリックされたときだけ書き出し、同じ条件のファイルは再利用する）
+        with st.expander("表示中のデータをダウンロード"):
+            col1, col2 = st.columns(2)
+            with col1:
+                export_format = st.selectbox("形式", list(EXPORT_FORMATS))
+            with col2:
+                include_indicators = st.checkbox("テクニカル指標を含める", value=False, disabled=not indicator_names)
+                include_labels = st.checkbox("政権・イベント名を含める", value=False)
+
+            start = sp500_full.index.searchsorted(view.index[0])
+            stop = start + len(view)
+            export_indicators = indicator_names if include_indicators else []
+            export_key = page_key + (start, stop, export_format, tuple(export_indicators), ma_period, include_labels)
 
-        plt.tight_layout()
-        return fig
+            def write(path):
+                frame = build_export_frame(
+                    sp500_full, start, stop,
+                    indicator_values=indicator_columns(get_indicator_engine(), export_indicators, ma_period,
+                                                       sp500_full, data_version(sp500_full)),
+                    presidents=president_table if include_labels else None,
+                    events=events if include_labels else None,
+                )
+                write_export(frame, export_format, path)
 
-    # グラフを生成して表示
-    fig = generate_plot()
-    st.pyplot(fig)
+            extension, mime = EXPORT_FORMATS[export_format]
+            st.caption(f"{view.index[0].strftime('%Y-%m-%d')} から {view.index[-1].strftime('%Y-%m-%d')} まで（{len(view)}行）")
+            # クリック時にページを再実行しない
+            st.download_button(
+                label=f"{export_format}としてS&P500データをダウンロード",
+                data=lambda: get_export_cache().get_or_write(export_key, export_format, write),
+                file_name=f"sp500_data{extension}",
+                mime=mime,
+                on_click="ignore",
+            )
+
+    # ページ全体の設定のうちグラフに影響するもの（カタログファイルが更新された場合も別のキーになる）
+    page_key = (
+        data_version(sp500_full), start_year,
+        tuple((ticker, data_version(df)) for ticker, df in comparison_frames.items()),
+        event_file.signature, president_file.signature,
+        tuple(selected_categories), max_events, show_presidents,
+    )
+    chart_section(sp500_full, sp500, comparison_frames, events, show_presidents, page_key)
+
+    # 表示期間の統計（データと開始年が変わらない間はキャッシュを使用）
+    @st.cache_data
+    def compute_summary_stats(version, start_date, _sp500):
+        close = _sp500['Close']
+        return {
+            "start_price": close.iloc[0],
+            "end_price": close.iloc[-1],
+            "max_price": close.max(),
+            "max_date": close.idxmax().strftime('%Y-%m-%d'),
+            "volatility": close.pct_change().std() * 100 * (252 ** 0.5),  # 年率換算
+        }
 
     # データ統計の表示
-    st.subheader("S&P500の統計情報")
+    with timer.stage("stats"):
+        st.subheader("S&P500の統計情報")
+        stats = compute_summary_stats(data_version(sp500_full), start_date, sp500)
     
-    col1, col2, col3 = st.columns(3)
+        col1, col2, col3 = st.columns(3)
     
-    with col1:
-        start_price = sp500['Close'].iloc[0]
-        end_price = sp500['Close'].iloc[-1]
-        percent_change = (end_price - start_price) / start_price * 100
-        st.metric("価格変化", f"{end_price:.2f} USD", f"{percent_change:.2f}%")
+        with col1:
+            percent_change = (stats["end_price"] - stats["start_price"]) / stats["start_price"] * 100
+            st.metric("価格変化", f"{stats['end_price']:.2f} USD", f"{percent_change:.2f}%")
     
-    with col2:
-        max_price = sp500['Close'].max()
-        max_date = sp500['Close'].idxmax().strftime('%Y-%m-%d')
-        st.metric("最高値", f"{max_price:.2f} USD", f"{max_date}に記録")
+        with col2:
+            st.metric("最高値", f"{stats['max_price']:.2f} USD", f"{stats['max_date']}に記録")
     
-    with col3:
-        volatility = sp500['Close'].pct_change().std() * 100 * (252 ** 0.5)  # 年率換算
-        st.metric("ボラティリティ (年率)", f"{volatility:.2f}%")
+        with col3:
+            st.metric("ボラティリティ (年率)", f"{stats['volatility']:.2f}%")
+
+    # 騰落率の色分け用の関数（政権別パフォーマンスとイベントスタディで使用）
+    def color_percent(val):
+        if val > 0:
+            return 'color: green'
+        elif val < 0:
+            return 'color: red'
+        return ''
 
     # 政権別のパフォーマンス表示
-    if show_presidents:
-        st.subheader("政権別のS&P500パフォーマンス")
-        
-        president_performance = []
-        
-        for president in presidents:
-            start_date_p = pd.to_datetime(president["start"])
-            end_date_p = pd.to_datetime(president["end"])
-            
-            # データの範囲内にある場合のみ計算
-            if end_date_p >= sp500.index[0] and start_date_p <= sp500.index[-1]:
-                # データの日付範囲に合わせて調整
-                actual_start = max(start_date_p, sp500.index[0])
-                actual_end = min(end_date_p, sp500.index[-1])
-                
-                # 該当期間のデータを取得
-                period_data = sp500.loc[actual_start:actual_end]
-                
-                if not period_data.empty:
-                    start_value = period_data['Close'].iloc[0]
-                    end_value = period_data['Close'].iloc[-1]
-                    percent_change = (end_value - start_value) / start_value * 100
-                    annual_return = ((1 + percent_change/100) ** (365.25/(len(period_data) + 1)) - 1) * 100 if len(period_data) > 0 else 0
-                    
-                    president_performance.append({
-                        "name": president["name"],
-                        "party": president["party"],
-                        "start": actual_start.strftime('%Y-%m-%d'),
-                        "end": actual_end.strftime('%Y-%m-%d'),
-                        "days": len(period_data),
-                        "start_value": start_value,
-                        "end_value": end_value,
-                        "percent_change": percent_change,
-                        "annual_return": annual_return
-                    })
+    with timer.stage("president_table"):
+        if show_presidents:
+            st.subheader("政権別のS&P500パフォーマンス")
         
-        # 表として表示
-        df_performance = pd.DataFrame(president_performance)
-        if not df_performance.empty:
-            # 色分け用の関数
-            def color_parties(val):
-                if val == "民主党":
-                    return 'background-color: lightblue'
-                elif val == "共和党":
-                    return 'background-color: lightcoral'
-                return ''
-            
-            def color_percent(val):
-                if val > 0:
-                    return 'color: green'
-                elif val < 0:
-                    return 'color: red'
-                return ''
-            
-            # 表示するカラムを選択
-            display_df = df_performance[['name', 'party', 'start', 'end', 'percent_change', 'annual_return']]
-            display_df.columns = ['大統領', '政党', '就任日', '退任日', '累積リターン(%)', '年率リターン(%)']
+            # 全政権の指標を一度に計算する（データ・開始年・政権カタログが変わらない間はキャッシュを使用）
+            @st.cache_data
+            def compute_president_performance(version, start_date, catalog_signature, _sp500, _presidents):
+                performance = period_performance(_sp500.index, _sp500['Close'], _presidents.starts, _presidents.ends)
+                performance.insert(0, "party", _presidents.parties[performance.index])
+                performance.insert(0, "name", _presidents.names[performance.index])
+                return performance.reset_index(drop=True)
+
+            # 表として表示
+            df_performance = compute_president_performance(
+                data_version(sp500_full), start_date, president_file.signature, sp500, president_table
+            )
+            if not df_performance.empty:
+                # 色分け用の関数
+                def color_parties(val):
+                    if val == "民主党":
+                        return 'background-color: lightblue'
+                    elif val == "共和党":
+                        return 'background-color: lightcoral'
+                    return ''
             
-            # 数値を丸める
-            display_df['累積リターン(%)'] = display_df['累積リターン(%)'].round(2)
-            display_df['年率リターン(%)'] = display_df['年率リターン(%)'].round(2)
+                # 表示するカラムを選択
+                display_df = pd.DataFrame({
+                    '大統領': df_performance['name'],
+                    '政党': df_performance['party'],
+                    '就任日': df_performance['start'].dt.strftime('%Y-%m-%d'),
+                    '退任日': df_performance['end'].dt.strftime('%Y-%m-%d'),
+                    # 数値を丸める
+                    '累積リターン(%)': df_performance['percent_change'].round(2),
+                    '年率リターン(%)': df_performance['annual_return'].round(2),
+                    'CAGR(%)': df_performance['cagr'].round(2),
+                    'ボラティリティ(%)': df_performance['volatility'].round(2),
+                    '最大ドローダウン(%)': df_performance['max_drawdown'].round(2),
+                })
             
-            # 条件付き書式でスタイル適用
-            styled_df = display_df.style.applymap(color_parties, subset=['政党'])\
-                                        .applymap(color_percent, subset=['累積リターン(%)', '年率リターン(%)'])
+                # 条件付き書式でスタイル適用
+                styled_df = display_df.style.map(color_parties, subset=['政党'])\
+                                            .map(color_percent, subset=['累積リターン(%)', '年率リターン(%)', 'CAGR(%)'])
             
-            st.dataframe(styled_df, height=400)
+                st.dataframe(styled_df, height=400)
 
     # イベント一覧の表示
-    if events:
-        st.subheader("主要イベントリスト")
+    with timer.stage("event_list"):
+        if len(events):
+            st.subheader("主要イベントリスト")
         
-        event_df = pd.DataFrame([
-            {"日付": pd.to_datetime(event["date"]).strftime('%Y-%m-%d'), 
-             "イベント": event["name"], 
-             "カテゴリ": event["category"]}
-            for event in events if pd.to_datetime(event["date"]) >= sp500.index[0] 
-                              and pd.to_datetime(event["date"]) <= sp500.index[-1]
-        ])
-        
-        if not event_df.empty:
+            event_df = pd.DataFrame({
+                "日付": pd.DatetimeIndex(events.dates).strftime('%Y-%m-%d'),
+                "イベント": events.names,
+                "カテゴリ": events.categories,
+            })
             st.dataframe(event_df, height=300)
 
-    # ダウンロードセクション
-    st.subheader("データダウンロード")
-    
-    csv = sp500.to_csv()
-    st.download_button(
-        label="CSVとしてS&P500データをダウンロード",
-        data=csv,
-        file_name='sp500_data.csv',
-        mime='text/csv',
-    )
-    
+    # イベントスタディ（イベント前後のリターンとイベント後の最大ドローダウン）
+    # 全イベントについて全履歴で一度に計算し、データとイベントカタログが変わらない間はキャッシュを使用
+    @st.cache_data
+    def compute_event_study(version, catalog_signature, _sp500_full, _event_table):
+        study = event_study(_sp500_full.index, _sp500_full['Close'], _event_table.dates)
+        study.insert(0, "category", _event_table.categories)
+        study.insert(0, "name", _event_table.names)
+        study.insert(0, "date", pd.DatetimeIndex(_event_table.dates))
+        return study
+
+    with timer.stage("event_study"):
+        study = compute_event_study(data_version(sp500_full), event_file.signature, sp500_full, event_table)
+        in_view = study['category'].isin(selected_categories) & study['date'].between(sp500.index[0], sp500.index[-1])
+        study = study[in_view & study['anchor_date'].notna()]
+        if not study.empty:
+            st.subheader("イベントスタディ（イベント前後のS&P500騰落率）")
+            return_columns = [column for column in study.columns if column.startswith("return_")]
+            column_names = {column: f"{column[len('return_'):]}日(%)" for column in return_columns}
+            column_names["max_drawdown"] = f"{EVENT_DRAWDOWN_WINDOW}日内の最大ドローダウン(%)"
+
+            # カテゴリごとの平均
+            summary = event_study_by_category(study, study['category']).round(2)
+            summary = summary.rename(columns=dict(column_names, count="件数"))
+            summary.index.name = "カテゴリ"
+            st.dataframe(summary.style.map(color_percent, subset=list(column_names.values())))
+
+            # イベントごとの結果
+            study_df = pd.DataFrame({
+                "日付": study['date'].dt.strftime('%Y-%m-%d'),
+                "イベント": study['name'],
+                "カテゴリ": study['category'],
+            })
+            for column, label in column_names.items():
+                study_df[label] = study[column].round(2)
+            st.dataframe(study_df.style.map(color_percent, subset=list(column_names.values())), height=300)
+
     # フッター
     st.markdown("---")
     st.markdown("データソース: Yahoo Finance (yfinance)")
-    st.markdown("最終更新: " + datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    # データの取得時刻と経過時間（バックグラウンドで更新されるため、表示中のデータの鮮度を示す）
+    fetched_at = ticker_cache.fetched_at('^GSPC')
+    age_minutes = int((time.time() - fetched_at) // 60)
+    age_text = f"{age_minutes // 60}時間{age_minutes % 60}分前" if age_minutes >= 60 else f"{age_minutes}分前"
+    st.markdown("最終更新: " + datetime.fromtimestamp(fetched_at).strftime("%Y-%m-%d %H:%M:%S") + f"（{age_text}に取得）")
 else:
     st.error("データを取得できませんでした。もう一度お試しください。")
+
+# この回の計測を記録する（環境変数で指定されたJSON Lines・Prometheus形式のファイルにも書き出す）
+counters = cache_counters() if sp500 is not None and not sp500.empty else []
+run_record = timer.finish(counters)
+
+# デバッグ情報（サイドバーで有効にしたときだけ表示）
+if st.sidebar.checkbox("デバッグ情報を表示", value=False):
+    with st.sidebar.expander("デバッグ情報", expanded=True):
+        st.markdown(f"今回の再実行: {run_record['rerun_seconds'] * 1000:.1f} ms")
+        summaries = get_metrics().summaries()
+        # 段階ごとの処理時間（今回と、直近の再実行の p50/p95）
+        stage_rows = []
+        for (metric, labels), summary in sorted(summaries.items()):
+            if metric not in ("stage_seconds", "rerun_seconds"):
+                continue
+            labels = dict(labels)
+            if metric == "rerun_seconds":
+                stage = "再実行全体" if labels.get("scope") == "full" else "グラフだけの再実行"
+                current = run_record["rerun_seconds"] if labels.get("scope") == "full" else None
+            else:
+                stage = labels["stage"]
+                current = run_record["stages"].get(stage)
+            stage_rows.append({
+                "段階": stage,
+                "今回(ms)": current * 1000 if current is not None else None,
+                "p50(ms)": summary["p50"] * 1000,
+                "p95(ms)": summary["p95"] * 1000,
+                "回数": summary["count"],
+            })
+        st.dataframe(pd.DataFrame(stage_rows).round(1), hide_index=True)
+        png_size = summaries.get(("chart_png_bytes", ()))
+        if png_size is not None:
+            st.markdown(f"グラフ画像のサイズ: p50 {png_size['p50'] / 1024:.0f} KiB / 最大 {png_size['max'] / 1024:.0f} KiB")
+        # キャッシュのヒット数などの累積値
+        st.dataframe(pd.DataFrame(
+            [{"指標": key, "値": value} for key, value in run_record["counters"].items()]
+        ), hide_index=True)
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+# 期間ごと（政権・FRB議長の任期・利上げ局面など）の株価パフォーマンス集計
+# 期間の境界は二分探索で求め、全期間の指標をgroupbyで一度に計算する
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+# 各期間に含まれる行位置を連結した配列と、各位置が属する期間番号を返す
+# 期間が重なっていても（境界日が前後の期間の両方に含まれる場合も）それぞれの期間に含める
+def _expand_ranges(lo, hi):
+    lengths = hi - lo
+    group = np.repeat(np.arange(len(lo)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return group, np.repeat(lo, lengths) + offsets
+
+
+# 期間ごとの累積リターン・年率リターン・CAGR・ボラティリティ・最大ドローダウンを計算する
+# dates: 日付順のdatetime64配列、close: 終値、starts/ends: 各期間の開始日・終了日（両端を含む）
+# 戻り値は期間内にデータが存在する期間のみを含み、インデックスは starts/ends の位置
+def period_performance(dates, close, starts, ends):
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    close = np.asarray(close, dtype="float64")
+    starts = np.asarray(starts, dtype="datetime64[ns]")
+    ends = np.asarray(ends, dtype="datetime64[ns]")
+    lo = np.searchsorted(dates, starts, side="left")
+    hi = np.searchsorted(dates, ends, side="right")
+    valid = np.flatnonzero(hi > lo)
+    lo, hi = lo[valid], hi[valid]
+
+    group, positions = _expand_ranges(lo, hi)
+    values = close[positions]
+    frame = pd.DataFrame({"group": group, "close": values})
+    grouped = frame.groupby("group", sort=True)["close"]
+
+    # 最大ドローダウン（期間内の最高値からの下落率の最小値）
+    drawdown = values / grouped.cummax().to_numpy() - 1
+    max_drawdown = pd.Series(drawdown).groupby(group).min().to_numpy()
+
+    # 日次リターンの標準偏差を年率換算したボラティリティ（期間をまたぐリターンは除く）
+    returns = np.full(len(values), np.nan)
+    same_period = group[1:] == group[:-1]
+    returns[1:][same_period] = values[1:][same_period] / values[:-1][same_period] - 1
+    volatility = pd.Series(returns).groupby(group).std().to_numpy() * np.sqrt(TRADING_DAYS_PER_YEAR)
+
+    days = hi - lo
+    start_value = close[lo]
+    end_value = close[hi - 1]
+    percent_change = (end_value - start_value) / start_value * 100
+    annual_return = ((1 + percent_change / 100) ** (365.25 / (days + 1)) - 1) * 100
+    calendar_days = (dates[hi - 1] - dates[lo]) / np.timedelta64(1, "D")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = np.where(calendar_days > 0, ((end_value / start_value) ** (365.25 / calendar_days) - 1) * 100, np.nan)
+
+    return pd.DataFrame({
+        # データの日付範囲に合わせて調整した期間
+        "start": pd.DatetimeIndex(np.maximum(starts[valid], dates[0])),
+        "end": pd.DatetimeIndex(np.minimum(ends[valid], dates[-1])),
+        "days": days,
+        "start_value": start_value,
+        "end_value": end_value,
+        "percent_change": percent_change,
+        "annual_return": annual_return,
+        "cagr": cagr,
+        "volatility": volatility * 100,
+        "max_drawdown": max_drawdown * 100,
+    }, index=valid)
+
+
+# イベントスタディで計算するリターンの窓（取引日数。負の値はイベント前からイベント日まで、正の値はイベント日から先）
+EVENT_WINDOWS = (-5, 1, 5, 20, 60)
+# イベント後の最大ドローダウンを計算する期間（取引日数）
+EVENT_DRAWDOWN_WINDOW = 60
+
+
+# 全イベントの前後のリターン（%）とイベント後の最大ドローダウン（%）を計算する
+# イベント日が休場日の場合は直後の取引日を基準日とする。窓がデータの範囲外になる場合はNaN
+# 最大ドローダウンは、基準日から drawdown_window 日後まで（データの末尾が先に来る場合は末尾まで）の期間で計算する
+# 全イベント×全窓の位置を二分探索と配列のインデックス参照で一度に求める（イベントごとのループはしない）
+def event_study(dates, close, event_dates, windows=EVENT_WINDOWS, drawdown_window=EVENT_DRAWDOWN_WINDOW):
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    close = np.asarray(close, dtype="float64")
+    event_dates = np.asarray(event_dates, dtype="datetime64[ns]")
+    n = len(close)
+    anchor = np.searchsorted(dates, event_dates, side="left")
+    # データの開始日より前・最終日より後のイベントは基準日なし
+    has_anchor = (anchor < n) & (event_dates >= dates[0])
+    anchor_value = close[np.minimum(anchor, n - 1)]
+
+    # (イベント数, 窓の数) の位置の表
+    windows = np.asarray(windows)
+    positions = anchor[:, None] + windows[None, :]
+    # イベント日より前にデータがない場合も除く（基準日が最初の取引日で窓が負）
+    in_range = has_anchor[:, None] & (positions >= 0) & (positions < n)
+    other_value = close[np.clip(positions, 0, n - 1)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.where(windows[None, :] < 0, anchor_value[:, None] / other_value, other_value / anchor_value[:, None])
+    returns = np.where(in_range, (returns - 1) * 100, np.nan)
+
+    # 基準日から drawdown_window 日後までの終値（範囲外はNaN）と、その期間の最高値からの下落率の最小値
+    ahead = anchor[:, None] + np.arange(drawdown_window + 1)[None, :]
+    path = np.where(ahead < n, close[np.minimum(ahead, n - 1)], np.nan)
+    path[~has_anchor] = np.nan
+    running_max = np.fmax.accumulate(path, axis=1)
+    with np.errstate(invalid="ignore"):
+        max_drawdown = np.nanmin(np.where(np.isnan(path), np.inf, path / running_max - 1), axis=1) * 100
+    max_drawdown[~has_anchor] = np.nan
+
+    frame = pd.DataFrame(returns, columns=[f"return_{window:+d}" for window in windows])
+    frame.insert(0, "anchor_date", pd.DatetimeIndex(np.where(has_anchor, dates[np.minimum(anchor, n - 1)],
+                                                             np.datetime64("NaT", "ns"))))
+    frame["max_drawdown"] = max_drawdown
+    return frame
+
+
+# イベントスタディの結果をカテゴリごとに集計する（件数と各指標の平均値。データ範囲外のイベントは件数に含めない）
+def event_study_by_category(study, categories):
+    columns = [column for column in study.columns if column.startswith("return_")] + ["max_drawdown"]
+    grouped = study[columns].groupby(np.asarray(categories), sort=False)
+    summary = grouped.mean()
+    summary.insert(0, "count", grouped["max_drawdown"].count())
+    return summary
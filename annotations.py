@@ -0,0 +1,190 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# グラフに重ねるイベントと政権期間のデータ
+# 日付は事前にdatetime64配列へ変換して日付順に保持し、期間での絞り込みは二分探索（searchsorted）で行う
+
+# 外部ファイルのカタログ（CSV・JSON・Parquetに対応、環境変数でファイルを差し替え可能）
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog")
+EVENTS_PATH = os.environ.get("SP500_EVENTS_PATH", os.path.join(CATALOG_DIR, "events.csv"))
+ADMINISTRATIONS_PATH = os.environ.get("SP500_ADMINISTRATIONS_PATH", os.path.join(CATALOG_DIR, "administrations.csv"))
+
+
+def _to_datetime64(values):
+    return pd.to_datetime(pd.Series(values, dtype="object")).to_numpy(dtype="datetime64[ns]")
+
+
+class EventTable:
+    COLUMNS = ["date", "name", "color", "category"]
+
+    def __init__(self, dates, names, colors, categories):
+        order = np.argsort(dates, kind="stable")
+        self.dates = dates[order]
+        self.names = names[order]
+        self.colors = colors[order]
+        self.categories = categories[order]
+        self._build_category_index()
+
+    # カテゴリごとのイベント位置（日付順）と日付の配列
+    def _build_category_index(self):
+        self._category_index = {}
+        order = np.argsort(self.categories, kind="stable")
+        sorted_categories = self.categories[order]
+        boundaries = np.flatnonzero(sorted_categories[1:] != sorted_categories[:-1]) + 1
+        for positions in np.split(order, boundaries):
+            if len(positions):
+                self._category_index[self.categories[positions[0]]] = (positions, self.dates[positions])
+
+    @classmethod
+    def from_records(cls, records):
+        return cls.from_frame(pd.DataFrame.from_records(list(records), columns=cls.COLUMNS))
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls(
+            _to_datetime64(frame["date"]),
+            frame["name"].to_numpy(dtype="object"),
+            frame["color"].to_numpy(dtype="object"),
+            frame["category"].to_numpy(dtype="object"),
+        )
+
+    def __len__(self):
+        return len(self.dates)
+
+    def take(self, indices):
+        table = object.__new__(EventTable)
+        table.dates = self.dates[indices]
+        table.names = self.names[indices]
+        table.colors = self.colors[indices]
+        table.categories = self.categories[indices]
+        table._build_category_index()
+        return table
+
+    # 期間内（両端を含む）のイベントの位置範囲
+    def range_bounds(self, start, end):
+        lo = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), "ns"), side="left")
+        hi = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end), "ns"), side="right")
+        return lo, hi
+
+    # 選択されたカテゴリのうち、期間内のイベントを日付順に最大 limit 件まで取り出す
+    # カテゴリごとの索引を二分探索し、各カテゴリから先頭 limit 件だけを集めて併合する（O(log n + k)）
+    def select(self, categories, start, end, limit=None):
+        start = np.datetime64(pd.Timestamp(start), "ns")
+        end = np.datetime64(pd.Timestamp(end), "ns")
+        candidates = []
+        for category in categories:
+            if category not in self._category_index:
+                continue
+            positions, dates = self._category_index[category]
+            lo = np.searchsorted(dates, start, side="left")
+            hi = np.searchsorted(dates, end, side="right")
+            if limit is not None:
+                hi = min(hi, lo + limit)
+            candidates.append(positions[lo:hi])
+        if not candidates:
+            return self.take(np.array([], dtype="int64"))
+        # 元のテーブルが日付順のため、位置の昇順は日付順と一致する
+        indices = np.sort(np.concatenate(candidates), kind="stable")
+        return self.take(indices[:limit])
+
+    def unique_categories(self):
+        return list(pd.unique(self.categories))
+
+    def to_frame(self):
+        return pd.DataFrame({
+            "date": self.dates,
+            "name": self.names,
+            "color": self.colors,
+            "category": self.categories,
+        })
+
+
+class AdministrationTable:
+    COLUMNS = ["name", "start", "end", "color", "party"]
+
+    def __init__(self, names, starts, ends, colors, parties):
+        order = np.argsort(starts, kind="stable")
+        self.names = names[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.colors = colors[order]
+        self.parties = parties[order]
+
+    @classmethod
+    def from_records(cls, records):
+        return cls.from_frame(pd.DataFrame.from_records(list(records), columns=cls.COLUMNS))
+
+    @classmethod
+    def from_frame(cls, frame):
+        # 終了日が空欄の政権（現職）は期限なしとして扱う
+        ends = _to_datetime64(frame["end"])
+        ends[np.isnat(ends)] = np.datetime64(pd.Timestamp.max, "ns")
+        return cls(
+            frame["name"].to_numpy(dtype="object"),
+            _to_datetime64(frame["start"]),
+            ends,
+            frame["color"].to_numpy(dtype="object"),
+            frame["party"].to_numpy(dtype="object"),
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    # 期間と重なる政権の位置と、期間に合わせて切り詰めた開始日・終了日
+    def clip(self, start, end):
+        start = np.datetime64(pd.Timestamp(start), "ns")
+        end = np.datetime64(pd.Timestamp(end), "ns")
+        indices = np.flatnonzero((self.ends >= start) & (self.starts <= end))
+        return indices, np.maximum(self.starts[indices], start), np.minimum(self.ends[indices], end)
+
+    # 政党ごとの凡例（最初に登場した政権の色を使う）
+    def party_colors(self):
+        _, first = np.unique(self.parties, return_index=True)
+        first.sort()
+        return list(zip(self.parties[first], self.colors[first]))
+
+
+# カタログファイルを拡張子に応じて読み込む
+def read_catalog_file(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".parquet":
+        return pd.read_parquet(path)
+    if extension == ".json":
+        return pd.read_json(path, orient="records", dtype=False)
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+class CatalogFile:
+    # カタログファイルを一度だけ読み込んで保持し、ファイルが更新されたときだけ読み直す
+    def __init__(self, path, table_class):
+        self.path = path
+        self.table_class = table_class
+        self.signature = None
+        self._table = None
+        self._lock = threading.Lock()
+
+    # 編集中などでファイルが一時的に存在しない・読み込めない場合は、直前に読み込めた内容を返す
+    # （一度も読み込めていない場合は例外をそのまま送出する）
+    def get(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            if self._table is None:
+                raise
+            return self._table
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self.signature:
+            with self._lock:
+                if signature != self.signature:
+                    try:
+                        table = self.table_class.from_frame(read_catalog_file(self.path))
+                    except Exception:
+                        if self._table is None:
+                            raise
+                        return self._table
+                    self._table = table
+                    self.signature = signature
+        return self._table
@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "ai-business-dashboard.py")
+
+# ダッシュボード全体のベンチマーク
+# Yahoo Financeの代わりに合成データのプロバイダを使い、StreamlitのAppTestでスクリプトをヘッドレスに実行して、
+# 初回起動・変更なしの再実行・開始年スライダーの操作・各設定の切り替えにかかる時間と最大メモリ使用量を計測する
+# 結果は項目の順序が固定されたJSONで出力し、--compare で以前の結果（別のコミット）と比較できる
+# ネットワーク・ディスプレイのないLinux環境で実行できる
+#
+# 実行例:
+#   python benchmarks/bench_dashboard.py --bars 9000 --output before.json
+#   python benchmarks/bench_dashboard.py --bars 2000000 --freq min --repeat 3 --compare before.json
+#
+# 注意: AppTestはフラグメントだけの再実行に対応していないため、グラフの表示設定の切り替えもスクリプト全体の再実行として計測される
+
+# 結果のJSONの形式のバージョン（項目を変更した場合に上げる）
+SCHEMA_VERSION = 1
+
+
+class SyntheticProvider:
+    # 合成データのプロバイダ（SP500_PRICE_PROVIDER=bench_dashboard:SyntheticProvider で読み込まれる）
+    # 本数と間隔は環境変数 BENCH_BARS / BENCH_FREQ で指定する（ダッシュボードのプロセス内で生成されるため）
+    # 同じティッカーには常に同じ系列を返す。終了日は固定し、実行日によって結果が変わらないようにする
+    def __init__(self, bars=None, freq=None, end="2024-12-31"):
+        self.bars = int(bars or os.environ.get("BENCH_BARS", 9000))
+        self.freq = freq or os.environ.get("BENCH_FREQ", "B")
+        self.end = end
+        self.calls = 0
+
+    def _frame(self, ticker):
+        index = pd.date_range(end=self.end, periods=self.bars, freq=self.freq)
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        # 日中足の場合は1本あたりの変動を日足の変動から換算する
+        scale = 1.0 if self.freq == "B" else np.sqrt(pd.Timedelta(pd.tseries.frequencies.to_offset(self.freq))
+                                                     / pd.Timedelta(days=1))
+        close = 1000 * np.exp(np.cumsum(rng.normal(0.0003 * scale ** 2, 0.01 * scale, self.bars)))
+        return pd.DataFrame({
+            "Open": close,
+            "High": close * 1.005,
+            "Low": close * 0.995,
+            "Close": close,
+            "Volume": rng.integers(1_000_000_000, 5_000_000_000, self.bars),
+        }, index=index.rename("Date"))
+
+    def fetch(self, ticker, start, end=None):
+        self.calls += 1
+        df = self._frame(ticker)
+        return df.loc[pd.Timestamp(start):pd.Timestamp(end) if end is not None else None]
+
+
+def _find(elements, label):
+    for element in elements:
+        if label in element.label:
+            return element
+    raise LookupError(f"ウィジェットが見つかりません: {label}")
+
+
+# (名前, 操作) の並び。操作は呼ばれるたびに値を変える（同じ値の再実行にならないようにする）
+# 各値の並びは先頭をウィジェットの既定値以外にし、1回目の操作から値が変わるようにする
+def _scenarios():
+    def cycle(values):
+        state = {"i": 0}
+
+        def next_value():
+            value = values[state["i"] % len(values)]
+            state["i"] += 1
+            return value
+        return next_value
+
+    years = cycle([2010, 1995, 2020, 2000])
+    styles = cycle(["ダークテーマ", "ミニマル", "科学論文風", "デフォルト"])
+    events = cycle([10, 30, 20])
+    categories = cycle([["金融危機"], ["金融危機", "金融政策", "地政学的事件", "健康危機"]])
+    tickers = cycle([["^DJI"], []])
+    indicators = cycle([["EMA", "BB", "DD", "VOL"], []])
+    modes = cycle(["インタラクティブ", "画像"])
+
+    def toggle(element):
+        element.set_value(not element.value)
+
+    return [
+        ("warm_rerun", lambda at: None),
+        ("start_year_slider", lambda at: _find(at.sidebar.slider, "開始年").set_value(years())),
+        ("max_events_slider", lambda at: _find(at.sidebar.slider, "イベントの最大数").set_value(events())),
+        ("event_categories", lambda at: _find(at.sidebar.multiselect, "イベントカテゴリ").set_value(categories())),
+        ("comparison_tickers", lambda at: _find(at.sidebar.multiselect, "比較する").set_value(tickers())),
+        ("show_presidents", lambda at: toggle(_find(at.sidebar.checkbox, "政権の期間"))),
+        ("graph_style", lambda at: _find(at.selectbox, "グラフスタイル").set_value(styles())),
+        ("show_volume", lambda at: toggle(_find(at.checkbox, "出来高"))),
+        ("show_ma", lambda at: toggle(_find(at.checkbox, "移動平均線"))),
+        ("indicators", lambda at: _find(at.multiselect, "テクニカル指標").set_value(indicators())),
+        ("chart_mode", lambda at: _find(at.radio, "表示方式").set_value(modes())),
+        ("debug_panel", lambda at: toggle(_find(at.sidebar.checkbox, "デバッグ情報"))),
+    ]
+
+
+def _timed_run(at):
+    start = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"スクリプトの実行中に例外が発生しました: {at.exception[0].message}")
+    return elapsed
+
+
+def _summary(samples):
+    return {
+        "median_s": round(statistics.median(samples), 4),
+        "min_s": round(min(samples), 4),
+        "max_s": round(max(samples), 4),
+        "runs": len(samples),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(args):
+    # 実行中のプロセスの環境変数でダッシュボードの設定を差し替える
+    data_dir = tempfile.mkdtemp(prefix="bench-dashboard-")
+    os.environ.update({
+        "SP500_PRICE_PROVIDER": "bench_dashboard:SyntheticProvider",
+        "SP500_DATA_DIR": data_dir,
+        "BENCH_BARS": str(args.bars),
+        "BENCH_FREQ": args.freq,
+        "MPLBACKEND": "Agg",
+    })
+    for name in ("SP500_METRICS_JSONL", "SP500_METRICS_PROMETHEUS", "RENDER_WORKERS"):
+        os.environ.pop(name, None)
+
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    results = {}
+    try:
+        # 初回起動（保存済みのデータなし・全キャッシュが空の状態から）
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        at = AppTest.from_file(SCRIPT, default_timeout=args.timeout)
+        results["cold_start"] = _summary([_timed_run(at)])
+
+        for name, action in _scenarios():
+            samples = []
+            for _ in range(args.repeat):
+                action(at)
+                samples.append(_timed_run(at))
+            results[name] = _summary(samples)
+    finally:
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        if args.tracemalloc:
+            tracemalloc.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    import matplotlib
+    import streamlit
+    return {
+        "schema": SCHEMA_VERSION,
+        "commit": _git_commit(),
+        "config": {"bars": args.bars, "freq": args.freq, "repeat": args.repeat},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "matplotlib": matplotlib.__version__,
+            "streamlit": streamlit.__version__,
+        },
+        "results": results,
+        "memory": {
+            # Linuxのru_maxrssはKiB単位
+            "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "tracemalloc_peak_bytes": traced_peak,
+        },
+    }
+
+
+# 以前の結果との比較（中央値の比。1より大きい場合は遅くなっている）
+def print_comparison(previous, current):
+    print(f"{'scenario':<22}{'before_s':>10}{'after_s':>10}{'ratio':>8}", file=sys.stderr)
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if before is None:
+            continue
+        ratio = result["median_s"] / before["median_s"] if before["median_s"] else float("nan")
+        print(f"{name:<22}{before['median_s']:>10.3f}{result['median_s']:>10.3f}{ratio:>8.2f}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bars", type=int, default=9000, help="合成データの本数（既定は約35年分の日足）")
+    parser.add_argument("--freq", default="B", help="合成データの間隔（pandasの頻度。B=営業日、min=1分足）")
+    parser.add_argument("--repeat", type=int, default=5, help="各操作の繰り返し回数")
+    parser.add_argument("--timeout", type=float, default=600, help="1回の実行のタイムアウト（秒）")
+    parser.add_argument("--tracemalloc", action="store_true", help="Pythonのメモリ割り当ての最大値も計測する（低速）")
+    parser.add_argument("--output", help="結果のJSONの出力先（省略時は標準出力）")
+    parser.add_argument("--compare", help="比較する以前の結果のJSON")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    text = json.dumps(result, ensure_ascii=False, indent=2) + "\n"
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
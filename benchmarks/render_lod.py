@@ -0,0 +1,48 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chart_renderer import build_chart_spec, render_chart  # noqa: E402
+from downsample import DEFAULT_MAX_POINTS  # noqa: E402
+from indicators import IndicatorEngine, build_overlays  # noqa: E402
+from render_soak import EVENT_TABLE, PRESIDENT_TABLE, synthetic_prices  # noqa: E402
+
+# 間引き（Level of Detail）の有無による描画時間の比較
+# 間引きありの場合、描画時間がデータの年数にほぼ依存しないことを確認する
+#
+# 実行例: python benchmarks/render_lod.py --years 5 10 20 35
+
+
+def time_render(sp500, max_points, repeat, dpi):
+    # 50日移動平均（指標の計算は描画時間に含めない）
+    overlays = build_overlays(IndicatorEngine(), ["SMA"], 50, sp500, "bench", 0)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        spec = build_chart_spec(sp500, PRESIDENT_TABLE, EVENT_TABLE, show_volume=True, overlays=overlays,
+                                max_points=max_points)
+        render_chart(spec, dpi=dpi)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, nargs="+", default=[5, 10, 20, 35])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dpi", type=int, default=100)
+    args = parser.parse_args()
+
+    print("years\tpoints\tlod_ms\tfull_ms")
+    for years in args.years:
+        sp500 = synthetic_prices(years)
+        lod = time_render(sp500, DEFAULT_MAX_POINTS, args.repeat, args.dpi)
+        full = time_render(sp500, None, args.repeat, args.dpi)
+        print(f"{years:g}\t{len(sp500)}\t{lod * 1000:.0f}\t{full * 1000:.0f}")
+
+
+if __name__ == "__main__":
+    main()
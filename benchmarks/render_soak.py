@@ -0,0 +1,95 @@
+import argparse
+import gc
+import os
+import sys
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib as mpl
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from annotations import AdministrationTable, EventTable  # noqa: E402
+from chart_renderer import GRAPH_STYLES, build_chart_spec, render_chart  # noqa: E402
+
+# グラフ描画のソークテスト
+# 複数スレッドから異なるスタイルで繰り返し描画し、以下を確認する
+#   - 並行描画の結果が単独で描画した結果と一致する（スタイルが他の描画に漏れない）
+#   - グローバルなrcParamsが変更されない
+#   - 描画を繰り返してもメモリ使用量が増え続けない
+#
+# 実行例: python benchmarks/render_soak.py --iterations 2000 --threads 8
+
+
+def synthetic_prices(years):
+    index = pd.bdate_range(end="2024-12-31", periods=int(years * 252))
+    rng = np.random.default_rng(0)
+    close = 1000 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, len(index))))
+    volume = rng.integers(1_000_000_000, 5_000_000_000, len(index))
+    return pd.DataFrame({"Close": close, "Volume": volume}, index=index)
+
+
+PRESIDENT_TABLE = AdministrationTable.from_records([
+    {"name": "オバマ", "start": "2009-01-20", "end": "2017-01-20", "color": "lightblue", "party": "民主党"},
+    {"name": "トランプ", "start": "2017-01-20", "end": "2021-01-20", "color": "lightcoral", "party": "共和党"},
+    {"name": "バイデン", "start": "2021-01-20", "end": "2025-01-20", "color": "lightblue", "party": "民主党"},
+])
+EVENT_TABLE = EventTable.from_records([
+    {"date": "2020-03-11", "name": "WHOがCOVID-19のパンデミック宣言", "color": "red", "category": "健康危機"},
+    {"date": "2022-02-24", "name": "ロシアのウクライナ侵攻", "color": "orange", "category": "地政学的事件"},
+])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--dpi", type=int, default=50)
+    parser.add_argument("--max-growth-kib", type=int, default=1024,
+                        help="許容するメモリ増加量（KiB）。超えた場合は終了コード1で終了する")
+    args = parser.parse_args()
+
+    sp500 = synthetic_prices(args.years)
+    styles = list(GRAPH_STYLES)
+    rc_before = dict(mpl.rcParams)
+
+    def render(i):
+        style = styles[i % len(styles)]
+        spec = build_chart_spec(sp500, PRESIDENT_TABLE, EVENT_TABLE, graph_style=style)
+        return style, render_chart(spec, dpi=args.dpi)
+
+    # 基準となる単独描画の結果
+    expected = dict(render(i) for i in range(len(styles)))
+
+    tracemalloc.start()
+    samples = []
+    mismatches = 0
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for i, (style, image) in enumerate(pool.map(render, range(args.iterations))):
+            if image != expected[style]:
+                mismatches += 1
+            if i % max(1, args.iterations // 10) == 0:
+                gc.collect()
+                samples.append(tracemalloc.get_traced_memory()[0])
+    gc.collect()
+    samples.append(tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+
+    rc_changed = sorted(key for key, value in mpl.rcParams.items() if rc_before.get(key) != value)
+    growth = samples[-1] - samples[1] if len(samples) > 1 else 0
+
+    print(f"iterations={args.iterations} threads={args.threads} active_threads={threading.active_count()}")
+    print(f"style_mismatches={mismatches}")
+    print(f"rcparams_changed={rc_changed}")
+    print("traced_memory_kib=" + ",".join(str(sample // 1024) for sample in samples))
+    print(f"memory_growth_kib={growth // 1024} max_growth_kib={args.max_growth_kib}")
+    leaked = growth // 1024 > args.max_growth_kib
+    return 0 if mismatches == 0 and not rc_changed and not leaked else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import heapq
+import io
+import platform
+import threading
+from functools import lru_cache
+
+import matplotlib as mpl
+import matplotlib.collections as mcollections
+import matplotlib.dates as mdates
+import matplotlib.font_manager as font_manager
+import matplotlib.patches as mpatches
+import matplotlib.style as mstyle
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+import japanize_matplotlib  # noqa: F401  同梱の日本語フォント（IPAexGothic）を登録する
+
+from downsample import DEFAULT_MAX_POINTS, bucket_means, minmax_indices
+
+# S&P500のグラフ描画
+# pyplotのグローバル状態（現在のFigure・スタイル）を使わず、Figureオブジェクトを直接生成して描画する
+
+# グラフスタイルごとのmatplotlibスタイル候補（バージョン間で名前が異なるため先頭から順に利用可能なものを使う）
+GRAPH_STYLES = {
+    "デフォルト": ["default"],
+    "ダークテーマ": ["dark_background"],
+    "ミニマル": ["seaborn-minimal", "seaborn-v0_8-white", "default"],
+    "科学論文風": ["seaborn-whitegrid", "seaborn-v0_8-whitegrid", "default"],
+}
+
+# 比較ティッカーの線の色
+COMPARISON_COLORS = ["tab:blue", "tab:orange", "tab:green", "tab:purple", "tab:brown",
+                     "tab:pink", "tab:olive", "tab:cyan", "tab:gray", "navy", "darkgoldenrod"]
+
+# イベント名ラベル（縦書き）の太さ（フォントサイズと枠の余白、ポイント）と高さの段数
+LABEL_THICKNESS_PT = 12
+LABEL_LEVELS = 5
+
+# rcParamsはプロセス全体で共有されるため、スタイルを適用して描画する区間は排他制御する
+_RC_LOCK = threading.RLock()
+
+
+# グラフスタイル名から利用可能なmatplotlibスタイルを選ぶ
+def resolve_style(graph_style):
+    for style in GRAPH_STYLES.get(graph_style, ["default"]):
+        if style == "default" or style in mstyle.available:
+            return style
+    return "default"
+
+
+# 終値の線・文字の色（ダークテーマでは白）
+def foreground_color(graph_style):
+    return 'white' if graph_style == "ダークテーマ" else 'black'
+
+
+# 日本語フォントの設定（プラットフォームに応じて適切なフォントを設定）
+# グローバルなrcParamsは変更せず、描画時のコンテキストに渡す設定を返す
+@lru_cache(maxsize=None)
+def japanese_font_rc():
+    os_name = platform.system()
+    if os_name == 'Windows':
+        font_family = "MS Gothic"
+    elif os_name == 'Darwin':  # Mac OS
+        font_family = "Hiragino Sans GB"
+    else:  # Linux その他
+        font_family = "IPAGothic"
+    # 指定フォントがない環境ではjapanize_matplotlib同梱のフォントを使用
+    installed = {font.name for font in font_manager.fontManager.ttflist}
+    families = [family for family in (font_family, "IPAexGothic") if family in installed]
+    return {
+        'font.family': families + ["sans-serif"],
+        # マイナス記号を正しく表示
+        'axes.unicode_minus': False,
+    }
+
+
+# 描画に必要なデータだけをまとめた仕様（NumPy配列と文字列のみで構成し、別プロセスへそのまま渡せる）
+# max_points を指定すると、終値・指標・出来高をグラフの横幅程度の点数まで間引く（Noneの場合は全データ）
+# presidents は AdministrationTable、events は EventTable（annotations.py）
+# overlays は sp500 の各行に対応する指標の系列（indicators.build_overlays）
+# comparisons は sp500 の各行に揃えて開始日=100に指数化した比較ティッカーの系列。指定した場合はS&P500も指数化する
+def build_chart_spec(sp500, presidents, events, graph_style="デフォルト", show_presidents=True,
+                     show_volume=False, overlays=(), comparisons=(), max_points=DEFAULT_MAX_POINTS):
+    dates = sp500.index.to_numpy(dtype="datetime64[ns]")
+    close = sp500['Close'].to_numpy(dtype="float64")
+    volume = sp500['Volume'].to_numpy(dtype="float64") if show_volume else None
+
+    # 比較表示では価格軸の系列を開始日=100に揃える
+    price_scale = 100.0 / close[0] if comparisons else 1.0
+    close = close * price_scale
+
+    if max_points:
+        close_idx = minmax_indices(close, max_points)
+        volume_idx, volume = bucket_means(volume, max_points) if volume is not None else (None, None)
+    else:
+        close_idx = volume_idx = slice(None)
+
+    overlay_specs = []
+    for overlay in overlays:
+        values = np.asarray(overlay["values"], dtype="float64")
+        if overlay["axis"] == "price":
+            values = values * price_scale
+        overlay_idx = minmax_indices(values, max_points) if max_points else slice(None)
+        overlay_specs.append(dict(overlay, dates=dates[overlay_idx], values=values[overlay_idx]))
+
+    comparison_specs = []
+    for comparison in comparisons:
+        values = np.asarray(comparison["values"], dtype="float64")
+        comparison_idx = minmax_indices(values, max_points) if max_points else slice(None)
+        comparison_specs.append({"label": comparison["label"], "dates": dates[comparison_idx],
+                                 "values": values[comparison_idx]})
+
+    # 表示期間と重なる政権を期間内に切り詰め、期間外のイベントを除く
+    president_idx, president_starts, president_ends = presidents.clip(dates[0], dates[-1])
+    event_lo, event_hi = events.range_bounds(dates[0], dates[-1])
+
+    return {
+        "dates": dates[close_idx],
+        "close": close[close_idx],
+        "overlays": overlay_specs,
+        "comparisons": comparison_specs,
+        "volume_dates": dates[volume_idx] if volume is not None else None,
+        "volume": volume,
+        "presidents": {
+            "names": presidents.names[president_idx],
+            "starts": president_starts,
+            "ends": president_ends,
+            "colors": presidents.colors[president_idx],
+            "parties": presidents.party_colors(),
+        } if show_presidents else None,
+        "events": {
+            "dates": events.dates[event_lo:event_hi],
+            "names": events.names[event_lo:event_hi],
+            "colors": events.colors[event_lo:event_hi],
+        },
+        "graph_style": graph_style,
+        "show_presidents": show_presidents,
+    }
+
+
+# グラフを描画してPNGのバイト列を返す
+def render_chart(spec, dpi=200):
+    with _RC_LOCK, mstyle.context(resolve_style(spec["graph_style"])), mpl.rc_context(japanese_font_rc()):
+        fig = Figure(figsize=(12, 8))
+        try:
+            _draw_chart(fig, spec)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png', bbox_inches='tight', dpi=dpi)
+            return buffer.getvalue()
+        finally:
+            # Figureが保持する描画オブジェクトを解放する
+            fig.clear()
+
+
+def _draw_chart(fig, spec):
+    dates = pd.DatetimeIndex(spec["dates"])
+    close = spec["close"]
+    graph_style = spec["graph_style"]
+    show_presidents = spec["show_presidents"]
+    show_volume = spec["volume"] is not None
+    ax = fig.add_subplot()
+    text_color = foreground_color(graph_style)
+
+    # メインプロット（S&P500の終値）
+    ax.plot(dates, close, color=text_color, linewidth=1.5, label='S&P500終値')
+
+    # 比較ティッカー（開始日=100に指数化済み）
+    for comparison, color in zip(spec["comparisons"], COMPARISON_COLORS):
+        ax.plot(comparison["dates"], comparison["values"], color=color, linewidth=1.2, label=comparison["label"])
+
+    # 出来高をサブプロットとして追加
+    if show_volume:
+        # メインのaxesのサイズを調整して下部に出来高のスペースを確保
+        ax.set_position([0.1, 0.3, 0.8, 0.6])  # [left, bottom, width, height]
+
+        # 出来高用のaxesを作成
+        ax_volume = fig.add_axes([0.1, 0.1, 0.8, 0.15])  # [left, bottom, width, height]
+        # 1本ずつの棒ではなく、1つの塗りつぶし領域として描画する
+        ax_volume.fill_between(spec["volume_dates"], spec["volume"], step='post', color='gray', alpha=0.5, linewidth=0)
+        ax_volume.set_ylabel('出来高', fontsize=10)
+        ax_volume.tick_params(axis='x', labelsize=8, labelrotation=45)
+        ax_volume.tick_params(axis='y', labelsize=8)
+
+        # x軸の日付フォーマットを設定
+        ax_volume.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+        ax_volume.xaxis.set_major_locator(mdates.YearLocator(2))  # 2年ごとにメモリを設定
+
+    # テクニカル指標を追加（価格と単位が異なる指標は右側の%軸に描画）
+    _draw_overlays(ax, spec["overlays"])
+
+    # ラベルの高さの基準（表示期間の最高値）は一度だけ計算する
+    y_max = np.nanmax(close)
+
+    # 政権の背景色を設定と大統領名の表示
+    if show_presidents:
+        _draw_presidents(ax, spec["presidents"], y_max)
+
+    # 重要なイベントを縦線で表示
+    _draw_events(ax, spec["events"], y_max)
+
+    # x軸の日付フォーマットを設定
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    ax.xaxis.set_major_locator(mdates.YearLocator(2))  # 2年ごとにメモリを設定
+    ax.tick_params(axis='x', labelrotation=45)
+
+    # グリッドの設定
+    ax.grid(True, linestyle='--', alpha=0.7)
+
+    # 凡例の作成（政権）
+    if show_presidents:
+        # 政党ごとに一度だけ凡例に追加
+        president_patches = [
+            mpatches.Patch(color=color, alpha=0.3, label=f"{party}")
+            for party, color in spec["presidents"]["parties"]
+        ]
+        # 比較表示では、政権の凡例とは別に各系列の凡例を右下に表示する
+        if spec["comparisons"]:
+            ax.add_artist(ax.legend(loc='lower right'))
+        ax.legend(handles=president_patches, loc='upper left')
+    else:
+        ax.legend(loc='upper left')
+
+    # y軸ラベル
+    if spec["comparisons"]:
+        ax.set_ylabel('指数（開始日=100）', fontsize=12)
+    else:
+        ax.set_ylabel('S&P500終値', fontsize=12)
+
+    # タイトル
+    fig.suptitle('S&P500と政権変化・重要イベント', fontsize=16, fontweight='bold')
+    ax.set_title(f'{dates[0].strftime("%Y-%m-%d")} から {dates[-1].strftime("%Y-%m-%d")} まで',
+                 fontsize=12)
+
+    # 出来高のaxesは位置を手動で指定しているため、自動レイアウトは出来高なしの場合のみ適用する
+    if not show_volume:
+        fig.tight_layout()
+
+
+# 政権の期間を1つのPolyCollectionとして網掛けし、期間の中央に大統領名を表示する
+def _draw_presidents(ax, presidents, y_max):
+    starts = mdates.date2num(presidents["starts"])
+    ends = mdates.date2num(presidents["ends"])
+    if len(starts) == 0:
+        return
+
+    # x方向はデータ座標、y方向は軸の高さ全体（0〜1）とする長方形
+    verts = np.empty((len(starts), 4, 2))
+    verts[:, :, 0] = np.column_stack([starts, starts, ends, ends])
+    verts[:, :, 1] = [0, 1, 1, 0]
+    spans = mcollections.PolyCollection(
+        verts, facecolors=list(presidents["colors"]), edgecolors='none', alpha=0.3,
+        transform=ax.get_xaxis_transform(),
+    )
+    ax.add_collection(spans, autolim=False)
+
+    # 政権名をグラフ上部に表示（表示期間が存在する場合のみ）
+    mids = starts + (ends - starts) / 2
+    for mid, name, color in zip(mids[ends > starts], presidents["names"][ends > starts],
+                                presidents["colors"][ends > starts]):
+        ax.text(mid, y_max * 1.05, name,
+                horizontalalignment='center',
+                verticalalignment='bottom',
+                rotation=0,
+                fontsize=10,
+                color='black',
+                fontweight='bold',
+                bbox=dict(facecolor=color, alpha=0.4, pad=2, boxstyle='round,pad=0.3'))
+
+
+# イベントの縦線を1つのLineCollectionとして描画し、イベント名のラベルを表示する
+def _draw_events(ax, events, y_max):
+    dates = mdates.date2num(events["dates"])
+    if len(dates) == 0:
+        return
+
+    colors = list(events["colors"])
+    ax.vlines(dates, 0, 1, transform=ax.get_xaxis_transform(), colors=colors,
+              linestyles='--', linewidth=1.5)
+
+    # イベント名のラベルを表示（横方向に重なるラベルは別の高さの段に配置する）
+    x_min, x_max = ax.get_xlim()
+    axes_width_px = ax.get_window_extent().width
+    label_width = (x_max - x_min) * (LABEL_THICKNESS_PT * ax.figure.dpi / 72) / axes_width_px
+    # どの段にも収まらないラベルは表示しない（縦線は表示し、イベント名はイベント一覧の表で確認できる）
+    levels = _label_levels(dates, label_width, LABEL_LEVELS)
+    y_positions = y_max * (0.5 + levels * 0.1)
+    for date, y_pos, level, name, color in zip(dates, y_positions, levels, events["names"], colors):
+        if level < 0:
+            continue
+        ax.text(date, y_pos, name, rotation=90,
+                verticalalignment='bottom', horizontalalignment='right',
+                fontsize=8, color=color, fontweight='bold',
+                bbox=dict(facecolor='white', alpha=0.7, edgecolor=color,
+                          pad=1, boxstyle='round,pad=0.2'))
+
+
+# 日付順のラベルに段（0〜max_levels-1）を割り当てる
+# 各段の右端をヒープで管理し、空いている段を再利用する（O(n log max_levels)）
+# すべての段が埋まっている場合は重ならないよう段を割り当てず -1 とする
+def _label_levels(x, width, max_levels):
+    levels = np.empty(len(x), dtype="int64")
+    free_at = []  # (段が空く位置, 段)
+    for i, xi in enumerate(x):
+        if free_at and free_at[0][0] <= xi:
+            _, level = heapq.heappop(free_at)
+        elif len(free_at) < max_levels:
+            level = len(free_at)
+        else:
+            levels[i] = -1
+            continue
+        levels[i] = level
+        heapq.heappush(free_at, (xi + width, level))
+    return levels
+
+
+def _draw_overlays(ax, overlays):
+    ax_percent = None
+    for overlay in overlays:
+        if overlay["axis"] == "price":
+            target = ax
+        else:
+            if ax_percent is None:
+                ax_percent = ax.twinx()
+                ax_percent.set_ylabel('%', fontsize=12)
+            target = ax_percent
+        target.plot(overlay["dates"], overlay["values"], color=overlay["color"], linestyle=overlay["linestyle"],
+                    linewidth=1.2, label=overlay["label"] if overlay["label"] else '_nolegend_')
+    if ax_percent is not None:
+        ax_percent.legend(loc='upper right')
@@ -0,0 +1,53 @@
+import numpy as np
+
+# 描画前の間引き（Level of Detail）
+# グラフの横幅（ピクセル数）程度まで点数を減らし、描画時間がデータ期間の長さに比例しないようにする
+
+# グラフの横幅に対する既定の最大点数（12インチ×約170dpi）
+DEFAULT_MAX_POINTS = 2000
+
+
+# 系列を区間（バケット）に分けたときの区間数と1区間あたりの点数
+def _bucket_shape(n, n_buckets):
+    bucket_size = -(-n // n_buckets)  # 切り上げ
+    return -(-n // bucket_size), bucket_size
+
+
+# 区間ごとに最小値と最大値の位置を残す（価格の急騰・急落の山や谷が消えない）
+# 戻り値は元の系列に対する昇順のインデックス（表示期間が変わらないよう先頭と末尾は必ず含める）
+def minmax_indices(values, max_points=DEFAULT_MAX_POINTS):
+    values = np.asarray(values, dtype="float64")
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+
+    n_buckets, bucket_size = _bucket_shape(n, max(1, max_points // 2))
+    padded = np.full(n_buckets * bucket_size, np.nan)
+    padded[:n] = values
+    buckets = padded.reshape(n_buckets, bucket_size)
+
+    # 欠損値は最小・最大の候補から外す（区間がすべて欠損の場合は先頭の位置になる）
+    offsets = np.arange(n_buckets) * bucket_size
+    min_pos = np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1) + offsets
+    max_pos = np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1) + offsets
+
+    indices = np.unique(np.concatenate([[0, n - 1], min_pos, max_pos]))
+    return indices[indices < n]
+
+
+# 区間ごとの平均値（出来高の集約に使用）。戻り値は (各区間の先頭インデックス, 平均値)
+def bucket_means(values, max_points=DEFAULT_MAX_POINTS):
+    values = np.asarray(values, dtype="float64")
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n), values
+
+    n_buckets, bucket_size = _bucket_shape(n, max_points)
+    padded = np.full(n_buckets * bucket_size, np.nan)
+    padded[:n] = values
+    buckets = padded.reshape(n_buckets, bucket_size)
+
+    counts = np.sum(~np.isnan(buckets), axis=1)
+    sums = np.nansum(buckets, axis=1)
+    means = np.divide(sums, counts, out=np.full(n_buckets, np.nan), where=counts > 0)
+    return np.arange(n_buckets) * bucket_size, means
@@ -0,0 +1,152 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from indicators import INDICATORS
+
+# データのダウンロード用の書き出し
+# ダウンロードが要求されたときだけ、一定の行数ごとに一時ファイルへ書き出す（全体の文字列をメモリに持たない）
+# 書き出したファイルは (データのバージョン, 期間, 形式, 含める列) ごとにプロセス全体で再利用する
+
+# 形式ごとの拡張子とMIMEタイプ
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "CSV（gzip圧縮）": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+# 1回に書き出す行数
+EXPORT_CHUNK_ROWS = 20000
+
+
+# 書き出す表（価格に、指定された指標・政権名・イベント名の列を加える）
+# start/stop は全履歴 sp500_full に対する行位置、indicator_values は {列名: 全履歴の配列}
+def build_export_frame(sp500_full, start, stop, indicator_values=None, presidents=None, events=None):
+    frame = sp500_full.iloc[start:stop]
+    columns = {column: frame[column].to_numpy() for column in frame.columns}
+    for column, values in (indicator_values or {}).items():
+        columns[column] = values[start:stop]
+
+    dates = frame.index.to_numpy(dtype="datetime64[ns]")
+    if presidents is not None and len(presidents):
+        # 各日付を含む政権（開始日が直前の政権のうち、終了日を過ぎていないもの）
+        position = np.searchsorted(presidents.starts, dates, side="right") - 1
+        valid = (position >= 0) & (dates <= presidents.ends[np.maximum(position, 0)])
+        columns["大統領"] = np.where(valid, presidents.names[np.maximum(position, 0)], None)
+    if events is not None:
+        # イベント日が休場日の場合は直後の取引日の行に付ける（同じ日の複数のイベントは連結する）
+        labels = np.full(len(dates), None, dtype="object")
+        position = np.searchsorted(dates, events.dates, side="left")
+        for row, name in zip(position, events.names):
+            if row < len(dates):
+                labels[row] = name if labels[row] is None else f"{labels[row]} / {name}"
+        columns["イベント"] = labels
+    return pd.DataFrame(columns, index=frame.index, copy=False)
+
+
+# 全履歴に対する指標の列（列名は "指標名(期間)_系列名"）
+def indicator_columns(engine, names, window, sp500_full, version):
+    dates = sp500_full.index.to_numpy(dtype="datetime64[ns]")
+    close = sp500_full['Close'].to_numpy()
+    columns = {}
+    for name in names:
+        result = engine.compute(name, window, dates, close, version)
+        prefix = name if name == "DD" else f"{name}({window})"
+        for column, _, _, _ in INDICATORS[name]["series"]:
+            columns[f"{prefix}_{column}"] = result[column]
+    return columns
+
+
+def write_csv(frame, path, compress=False, chunk_rows=EXPORT_CHUNK_ROWS):
+    opener = gzip.open if compress else open
+    with opener(path, "wt", encoding="utf-8", newline="") as f:
+        for offset in range(0, max(len(frame), 1), chunk_rows):
+            frame.iloc[offset:offset + chunk_rows].to_csv(f, header=offset == 0)
+
+
+def write_parquet(frame, path, chunk_rows=EXPORT_CHUNK_ROWS):
+    # 空の表から型を決めると文字列の列（政権名・イベント名）は型が決まらないため、文字列型にする
+    schema = pa.Schema.from_pandas(frame.iloc[:0])
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    with pq.ParquetWriter(path, schema) as writer:
+        for offset in range(0, len(frame), chunk_rows):
+            writer.write_table(pa.Table.from_pandas(frame.iloc[offset:offset + chunk_rows], schema=schema))
+
+
+def write_export(frame, export_format, path):
+    if export_format == "Parquet":
+        write_parquet(frame, path)
+    else:
+        write_csv(frame, path, compress=export_format == "CSV（gzip圧縮）")
+
+
+class ExportCache:
+    # 書き出したファイルをキーごとに一時ディレクトリに保持し、ファイル数の上限を超えたら古いものから削除する
+    # 書き出しはキャッシュ全体のロックの外で行い、同じキーの書き出しが実行中の場合はその完了を待つ
+    # （大きなファイルの書き出し中も、他のキーの書き出しやキャッシュ済みファイルの読み出しは待たされない）
+    def __init__(self, root=None, max_files=32):
+        self.root = root or tempfile.mkdtemp(prefix="sp500-export-")
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        self._paths = OrderedDict()
+        # キー -> 書き出し中であることを示すイベント（完了時にセットされる）
+        self._writing = {}
+        self._lock = threading.Lock()
+
+    # キーに対応するファイルのバイト列を返す（未作成の場合は write(path) で書き出す）
+    # Streamlitはダウンロードの応答を作るときに内容全体を読み込むため、ファイルを開いたまま渡さずにここで読み込んで閉じる
+    # ファイルはロック中に開き（上限を超えて削除されても読み出せる）、読み込みはロックの外で行う
+    def get_or_write(self, key, export_format, write):
+        while True:
+            with self._lock:
+                path = self._paths.get(key)
+                if path is not None and os.path.exists(path):
+                    self._paths.move_to_end(key)
+                    self.hits += 1
+                    f = open(path, "rb")
+                    break
+                pending = self._writing.get(key)
+                if pending is None:
+                    pending = self._writing[key] = threading.Event()
+                    self.misses += 1
+                    f = None
+                    break
+            # 同じキーの書き出しが終わるのを待ってから、書き出されたファイルを使う
+            pending.wait()
+
+        if f is None:
+            try:
+                f = self._write(key, export_format, write)
+            finally:
+                with self._lock:
+                    del self._writing[key]
+                pending.set()
+        with f:
+            return f.read()
+
+    # 書き出したファイルを登録し、読み取り用に開いて返す
+    def _write(self, key, export_format, write):
+        suffix = EXPORT_FORMATS[export_format][0]
+        path = os.path.join(self.root, hashlib.sha1(repr(key).encode()).hexdigest() + suffix)
+        # 書き出し途中のファイルを読まれないよう、一時ファイル経由で置き換える
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._paths[key] = path
+            while len(self._paths) > self.max_files:
+                _, old_path = self._paths.popitem(last=False)
+                if old_path != path and os.path.exists(old_path):
+                    os.remove(old_path)
+            return open(path, "rb")
@@ -0,0 +1,184 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# テクニカル指標（SMA・EMA・ボリンジャーバンド・ドローダウン・ローリングボラティリティ）
+# 全履歴に対してNumPyでまとめて計算し、(指標, パラメータ, データのバージョン) ごとにキャッシュする
+# 価格ストアに新しいバーが追記された場合は、末尾の必要な部分だけを再計算する
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+# 移動窓の合計（先頭 window-1 個はNaN）
+def _rolling_sum(values, window):
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        cumsum = np.concatenate([[0.0], np.cumsum(values)])
+        result[window - 1:] = cumsum[window:] - cumsum[:-window]
+    return result
+
+
+def sma(close, window):
+    return {"sma": _rolling_sum(close, window) / window}
+
+
+# 指数移動平均（seed は直前までの計算結果の最終値。末尾だけを再計算するときに使う）
+def ema(close, window, seed=None):
+    if seed is not None:
+        values = pd.Series(np.concatenate([[seed], close])).ewm(span=window, adjust=False).mean()
+        return {"ema": values.to_numpy()[1:]}
+    return {"ema": pd.Series(close).ewm(span=window, adjust=False).mean().to_numpy()}
+
+
+def bollinger(close, window, num_std=2.0):
+    # 桁落ちを抑えるため、平均を引いてから二乗和を計算する
+    offset = close[0] if len(close) else 0.0
+    centered = close - offset
+    mean = _rolling_sum(centered, window) / window
+    variance = np.maximum(_rolling_sum(centered ** 2, window) / window - mean ** 2, 0)
+    std = np.sqrt(variance)
+    mid = mean + offset
+    return {"mid": mid, "upper": mid + num_std * std, "lower": mid - num_std * std}
+
+
+# 直近の最高値からの下落率（%）。peak は直前までの最高値（末尾だけを再計算するときに使う）
+def drawdown(close, peak=None):
+    running_max = np.maximum.accumulate(close if peak is None else np.concatenate([[peak], close]))
+    if peak is not None:
+        running_max = running_max[1:]
+    return {"drawdown": (close / running_max - 1) * 100}
+
+
+# 日次対数リターンの移動標準偏差を年率換算したボラティリティ（%）
+def rolling_volatility(close, window):
+    returns = np.full(len(close), np.nan)
+    returns[1:] = np.diff(np.log(close))
+    valid = returns[1:]
+    mean = _rolling_sum(valid, window) / window
+    variance = np.maximum(_rolling_sum(valid ** 2, window) / window - mean ** 2, 0) * window / max(window - 1, 1)
+    returns[1:] = np.sqrt(variance * TRADING_DAYS_PER_YEAR) * 100
+    return {"volatility": returns}
+
+
+# 指標の定義
+#   label: 表示名、axis: 描画する軸（price=価格と同じ軸、percent=右側の%軸）
+#   series: 描画する系列（列名, 色, 線種, 凡例に表示するか）
+#   lookback: 末尾の再計算に必要な直前のデータ数（パラメータから計算）
+INDICATORS = {
+    "SMA": {"label": "単純移動平均", "func": sma, "axis": "price",
+            "series": [("sma", "red", "-", True)], "lookback": lambda window: window - 1},
+    "EMA": {"label": "指数移動平均", "func": ema, "axis": "price",
+            "series": [("ema", "darkorange", "-", True)], "lookback": None},
+    "BB": {"label": "ボリンジャーバンド", "func": bollinger, "axis": "price",
+           "series": [("upper", "royalblue", "--", True), ("lower", "royalblue", "--", False)],
+           "lookback": lambda window: window - 1},
+    "DD": {"label": "ドローダウン", "func": drawdown, "axis": "percent",
+           "series": [("drawdown", "purple", "-", True)], "lookback": None},
+    "VOL": {"label": "ボラティリティ(年率)", "func": rolling_volatility, "axis": "percent",
+            "series": [("volatility", "seagreen", "-", True)], "lookback": lambda window: window},
+}
+
+
+# 凡例に表示する名前
+def indicator_label(name, window):
+    if name == "SMA":
+        return f'{window}日移動平均'
+    if name == "EMA":
+        return f'{window}日指数移動平均'
+    if name == "BB":
+        return f'ボリンジャーバンド（{window}日, ±2σ）'
+    if name == "DD":
+        return 'ドローダウン(%)'
+    return f'{window}日ボラティリティ（年率, %）'
+
+
+def _params_for(name, window):
+    return {} if name == "DD" else {"window": window}
+
+
+class IndicatorEngine:
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.full_computes = 0
+        self.tail_computes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # 全履歴に対する指標を返す（読み取り専用の配列の辞書）
+    # dates は日付順のdatetime64配列、close は終値、version はデータのバージョン
+    def compute(self, name, window, dates, close, version):
+        params = _params_for(name, window)
+        key = (name, tuple(sorted(params.items())))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and entry["version"] == version:
+            return entry["result"]
+
+        close = np.asarray(close, dtype="float64")
+        result = None
+        if entry is not None:
+            result = self._extend(name, params, entry, dates, close)
+        if result is None:
+            result = INDICATORS[name]["func"](close, **params)
+            self.full_computes += 1
+        else:
+            self.tail_computes += 1
+
+        for values in result.values():
+            values.flags.writeable = False
+        with self._lock:
+            self._entries[key] = {
+                "version": version, "result": result, "length": len(close),
+                "last_date": dates[len(close) - 2] if len(close) > 1 else None,
+                "last_close": close[len(close) - 2] if len(close) > 1 else None,
+                # ドローダウンの追加計算に使う、最終バーより前の最高値
+                "peak": np.max(close[:-1]) if name == "DD" and len(close) > 1 else None,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    # 前回の結果に末尾だけを追加計算する（前回の最終バーは値が確定していない可能性があるため再計算する）
+    # 前回のデータと先頭部分が一致しない場合はNoneを返し、全体を再計算させる
+    def _extend(self, name, params, entry, dates, close):
+        keep = entry["length"] - 1
+        if keep < 1 or keep >= len(close):
+            return None
+        if dates[keep - 1] != entry["last_date"] or close[keep - 1] != entry["last_close"]:
+            return None
+
+        previous = entry["result"]
+        if name == "EMA":
+            tail = ema(close[keep:], params["window"], seed=previous["ema"][keep - 1])
+        elif name == "DD":
+            tail = drawdown(close[keep:], peak=entry["peak"])
+        else:
+            # 移動窓の指標は、窓に必要な直前のデータを含めて計算し、末尾だけを使う
+            start = max(0, keep - INDICATORS[name]["lookback"](**params))
+            tail = {column: values[keep - start:]
+                    for column, values in INDICATORS[name]["func"](close[start:], **params).items()}
+
+        return {column: np.concatenate([previous[column][:keep], tail[column]]) for column in previous}
+
+
+# グラフに重ねる系列の一覧を作る（全履歴で計算した結果から、表示期間 start:stop をビューとして切り出す）
+def build_overlays(engine, names, window, sp500_full, version, start, stop=None):
+    dates = sp500_full.index.to_numpy(dtype="datetime64[ns]")
+    close = sp500_full['Close'].to_numpy()
+    overlays = []
+    for name in names:
+        result = engine.compute(name, window, dates, close, version)
+        for column, color, linestyle, show_label in INDICATORS[name]["series"]:
+            overlays.append({
+                "label": indicator_label(name, window) if show_label else None,
+                "axis": INDICATORS[name]["axis"],
+                "color": color,
+                "linestyle": linestyle,
+                "values": result[column][start:stop],
+            })
+    return overlays
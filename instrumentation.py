@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# 再実行の各段階の処理時間・キャッシュのヒット数などの計測（プロセス全体で共有）
+# 観測値は指標ごとに直近 WINDOW_SIZE 件だけを保持し、p50/p95 を計算する
+# 環境変数で出力先を指定すると、再実行ごとにJSON Lines（1行1回）とPrometheusのテキスト形式のファイルに書き出す
+
+# p50/p95 の計算に使う直近の観測値の数
+WINDOW_SIZE = 1000
+
+# Prometheusの指標名の接頭辞
+METRIC_PREFIX = "sp500_dashboard"
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    def __init__(self, jsonl_path=None, prometheus_path=None, window=WINDOW_SIZE):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.window = window
+        # (指標名, ラベル) -> [直近の観測値, 観測回数, 合計]
+        self._observations = {}
+        # (指標名, ラベル) -> 累積値（各キャッシュが持つヒット数などを写したもの）
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    # 処理時間（秒）やバイト数などの観測値を記録する
+    def observe(self, metric, value, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            entry = self._observations.get(key)
+            if entry is None:
+                entry = self._observations[key] = [deque(maxlen=self.window), 0, 0.0]
+            entry[0].append(value)
+            entry[1] += 1
+            entry[2] += value
+
+    def set_counter(self, metric, value, **labels):
+        with self._lock:
+            self._counters[(metric, tuple(sorted(labels.items())))] = value
+
+    # 観測値の要約（回数・合計・直近の p50/p95/最大）
+    def summaries(self):
+        with self._lock:
+            items = [(key, np.array(entry[0], dtype="float64"), entry[1], entry[2])
+                     for key, entry in self._observations.items()]
+        result = {}
+        for key, values, count, total in items:
+            p50, p95 = np.percentile(values, [50, 95])
+            result[key] = {"count": count, "sum": total, "p50": p50, "p95": p95, "max": values.max()}
+        return result
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    # Prometheusのテキスト形式（観測値はsummary、累積値はcounterとして出力する）
+    def prometheus_text(self):
+        lines = []
+        summaries = self.summaries()
+        for metric in sorted({key[0] for key in summaries}):
+            name = f"{METRIC_PREFIX}_{metric}"
+            lines.append(f"# TYPE {name} summary")
+            for (key_metric, labels), summary in sorted(summaries.items()):
+                if key_metric != metric:
+                    continue
+                for quantile in ("0.5", "0.95"):
+                    value = summary["p50"] if quantile == "0.5" else summary["p95"]
+                    lines.append(f"{name}{_labels_text(labels + (('quantile', quantile),))} {value:.6g}")
+                lines.append(f"{name}_sum{_labels_text(labels)} {summary['sum']:.6g}")
+                lines.append(f"{name}_count{_labels_text(labels)} {summary['count']}")
+        counters = self.counters()
+        for metric in sorted({key[0] for key in counters}):
+            name = f"{METRIC_PREFIX}_{metric}"
+            lines.append(f"# TYPE {name} counter")
+            for (key_metric, labels), value in sorted(counters.items()):
+                if key_metric == metric:
+                    lines.append(f"{name}{_labels_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    # 1回の再実行の記録を書き出す（出力先が指定されていない場合は何もしない）
+    def export_run(self, record):
+        if self.jsonl_path:
+            line = json.dumps(record, ensure_ascii=False)
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        if self.prometheus_path:
+            # 書き込み途中のファイルを読まれないよう、一時ファイル経由で置き換える
+            tmp_path = f"{self.prometheus_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, self.prometheus_path)
+
+
+class RunTimer:
+    # 1回の再実行の段階ごとの処理時間を計測する
+    # scope は再実行の範囲（"full": スクリプト全体、"fragment": フラグメントだけの再実行）
+    def __init__(self, metrics, scope="full"):
+        self.metrics = metrics
+        self.scope = scope
+        self.stages = {}
+        self.finished = False
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            self.metrics.observe("stage_seconds", elapsed, stage=name)
+
+    # 再実行全体の処理時間を記録し、この回の記録（段階ごとの時間とキャッシュの累積値）を返す
+    # counters は (指標名, ラベルの辞書, 累積値) の並び
+    def finish(self, counters=()):
+        total = time.perf_counter() - self._start
+        self.finished = True
+        self.metrics.observe("rerun_seconds", total, scope=self.scope)
+        counter_values = {}
+        for metric, labels, value in counters:
+            self.metrics.set_counter(metric, value, **labels)
+            counter_values[f"{metric}{_labels_text(tuple(sorted(labels.items())))}"] = value
+        record = {
+            "timestamp": time.time(),
+            "scope": self.scope,
+            "rerun_seconds": total,
+            "stages": self.stages,
+            "counters": counter_values,
+        }
+        self.metrics.export_run(record)
+        return record
+
+
+# 環境変数から計測の出力先を設定する
+#   SP500_METRICS_JSONL: 再実行ごとの記録を追記するJSON Linesファイル
+#   SP500_METRICS_PROMETHEUS: Prometheusのテキスト形式で書き出すファイル（node_exporterのtextfile collector等で収集）
+def create_metrics():
+    return Metrics(
+        jsonl_path=os.environ.get("SP500_METRICS_JSONL") or None,
+        prometheus_path=os.environ.get("SP500_METRICS_PROMETHEUS") or None,
+    )
@@ -0,0 +1,170 @@
+import altair as alt
+import numpy as np
+import pandas as pd
+from matplotlib.colors import to_hex
+
+from chart_renderer import COMPARISON_COLORS, foreground_color
+
+# ブラウザ側で拡大・移動・ツールチップを処理するインタラクティブなグラフ（Vega-Lite / Altair）
+# 描画仕様（chart_renderer.build_chart_spec）を縦持ちのDataFrameに変換して送る
+# Streamlitはデータを列形式（Arrow）で送るため、点数を間引いた仕様を使えばデータ期間によらず送信量は一定になる
+#   概観: 表示期間全体を OVERVIEW_POINTS 点程度に間引いた終値。範囲を選択すると詳細の期間が変わる（再実行は選択時のみ）
+#   詳細: 選択された期間だけを最大点数まで間引いた系列。拡大・移動・ツールチップはブラウザ内で処理する
+
+# 概観に送る最大点数
+OVERVIEW_POINTS = 500
+
+# 概観で選択した範囲のパラメータ名（st.altair_chart の selection_mode に指定する）
+WINDOW_PARAM = "window"
+
+CLOSE_LABEL = "S&P500終値"
+
+
+# matplotlibの色名（"tab:blue" など）はVega-Liteで解釈できないため、16進数の色に変換する
+def _css_color(color):
+    return to_hex(color)
+
+
+# ダークテーマでは背景・軸・文字の色も画像のグラフに合わせる
+def _apply_style(chart, graph_style):
+    if graph_style != "ダークテーマ":
+        return chart
+    color = foreground_color(graph_style)
+    return chart.configure(background="black").configure_axis(
+        labelColor=color, titleColor=color, gridColor="#444444", domainColor=color, tickColor=color,
+    ).configure_legend(labelColor=color, titleColor=color).configure_title(color=color)
+
+
+def _line_frame(spec):
+    text_color = _css_color(foreground_color(spec["graph_style"]))
+    frames = [pd.DataFrame({"date": spec["dates"], "value": spec["close"], "series": CLOSE_LABEL, "line": 0})]
+    colors = {CLOSE_LABEL: text_color}
+    for line, comparison in enumerate(spec["comparisons"], start=1):
+        frames.append(pd.DataFrame({"date": comparison["dates"], "value": comparison["values"],
+                                    "series": comparison["label"], "line": line}))
+        colors[comparison["label"]] = _css_color(COMPARISON_COLORS[(line - 1) % len(COMPARISON_COLORS)])
+
+    percent_frames = []
+    label = None
+    for line, overlay in enumerate(spec["overlays"], start=len(frames)):
+        # 凡例のない系列（ボリンジャーバンドの下限など）は直前の系列と同じ凡例・色にまとめる
+        label = overlay["label"] or label
+        frame = pd.DataFrame({"date": overlay["dates"], "value": overlay["values"], "series": label, "line": line})
+        (percent_frames if overlay["axis"] == "percent" else frames).append(frame)
+        colors.setdefault(label, _css_color(overlay["color"]))
+
+    concat = lambda items: pd.concat(items, ignore_index=True).dropna(subset=["value"]) if items else None
+    return concat(frames), concat(percent_frames), colors
+
+
+def _color_scale(colors):
+    return alt.Scale(domain=list(colors), range=list(colors.values()))
+
+
+# 政権の期間（網掛け）とイベント（縦線）のレイヤー。ツールチップで名前と日付を表示する
+def _annotation_layers(spec):
+    layers = []
+    presidents = spec["presidents"]
+    if presidents is not None and len(presidents["names"]):
+        spans = pd.DataFrame({
+            "name": presidents["names"],
+            "start": presidents["starts"],
+            "end": presidents["ends"],
+            "color": [_css_color(color) for color in presidents["colors"]],
+        })
+        layers.append(alt.Chart(spans).mark_rect(opacity=0.15).encode(
+            x="start:T", x2="end:T",
+            color=alt.Color("color:N", scale=None),
+            tooltip=[alt.Tooltip("name:N", title="大統領"),
+                     alt.Tooltip("start:T", title="開始", format="%Y-%m-%d"),
+                     alt.Tooltip("end:T", title="終了", format="%Y-%m-%d")],
+        ))
+
+    events = spec["events"]
+    if len(events["names"]):
+        marks = pd.DataFrame({"date": events["dates"], "name": events["names"],
+                              "color": [_css_color(color) for color in events["colors"]]})
+        layers.append(alt.Chart(marks).mark_rule(strokeDash=[4, 3], opacity=0.7).encode(
+            x="date:T",
+            color=alt.Color("color:N", scale=None),
+            tooltip=[alt.Tooltip("name:N", title="イベント"),
+                     alt.Tooltip("date:T", title="日付", format="%Y-%m-%d")],
+        ))
+    return layers
+
+
+# 概観のグラフ（範囲を選択すると、その期間が詳細のグラフに表示される）
+# window は現在の詳細の期間 (開始日, 終了日)。再描画後も選択範囲を表示するために使う
+def build_overview_chart(spec, window=None):
+    text_color = _css_color(foreground_color(spec["graph_style"]))
+    data = pd.DataFrame({"date": spec["dates"], "close": spec["close"]})
+    if window is not None:
+        value = {"x": [alt.DateTime(**_datetime_parts(day)) for day in window]}
+        brush = alt.selection_interval(name=WINDOW_PARAM, encodings=["x"], value=value)
+    else:
+        brush = alt.selection_interval(name=WINDOW_PARAM, encodings=["x"])
+    chart = alt.Chart(data).mark_area(color=text_color, opacity=0.3, line={"color": text_color}).encode(
+        x=alt.X("date:T", title=None, axis=alt.Axis(format="%Y")),
+        y=alt.Y("close:Q", title=None, scale=alt.Scale(zero=False), axis=alt.Axis(labels=False, ticks=False)),
+    ).add_params(brush).properties(height=80, title="期間を選択（ドラッグ）")
+    return _apply_style(chart, spec["graph_style"])
+
+
+# 詳細のグラフ（価格のパネルを拡大・移動すると、%軸の指標・出来高のパネルの期間も連動する）
+def build_detail_chart(spec):
+    lines, percent_lines, colors = _line_frame(spec)
+    zoom = alt.selection_interval(name="zoom", encodings=["x"], bind="scales")
+    y_title = "指数（開始日=100）" if spec["comparisons"] else CLOSE_LABEL
+    x = alt.X("date:T", title=None, axis=alt.Axis(format="%Y-%m"))
+    linked_x = alt.X("date:T", title=None, axis=alt.Axis(format="%Y-%m"), scale=alt.Scale(domain={"param": "zoom"}))
+    tooltip = [alt.Tooltip("series:N", title="系列"), alt.Tooltip("date:T", title="日付", format="%Y-%m-%d"),
+               alt.Tooltip("value:Q", title="値", format=",.2f")]
+
+    price = alt.Chart(lines).mark_line(strokeWidth=1.3).encode(
+        x=x,
+        y=alt.Y("value:Q", title=y_title, scale=alt.Scale(zero=False)),
+        color=alt.Color("series:N", title=None, scale=_color_scale(colors), legend=alt.Legend(orient="top-left")),
+        detail="line:N",
+        tooltip=tooltip,
+    )
+    panels = [alt.layer(*_annotation_layers(spec), price).add_params(zoom).properties(height=420)]
+
+    if percent_lines is not None:
+        panels.append(alt.Chart(percent_lines).mark_line(strokeWidth=1).encode(
+            x=linked_x,
+            y=alt.Y("value:Q", title="%"),
+            color=alt.Color("series:N", title=None, scale=_color_scale(colors), legend=alt.Legend(orient="top-left")),
+            detail="line:N",
+            tooltip=tooltip,
+        ).properties(height=120))
+
+    if spec["volume"] is not None:
+        volume = pd.DataFrame({"date": spec["volume_dates"], "volume": spec["volume"]})
+        panels.append(alt.Chart(volume).mark_bar(opacity=0.5, color="gray").encode(
+            x=linked_x,
+            y=alt.Y("volume:Q", title="出来高"),
+            tooltip=[alt.Tooltip("date:T", title="日付", format="%Y-%m-%d"),
+                     alt.Tooltip("volume:Q", title="出来高", format=",.0f")],
+        ).properties(height=100))
+
+    # 凡例の色の割り当ては価格と%軸のパネルで独立させる
+    return _apply_style(alt.vconcat(*panels).resolve_scale(color="independent"), spec["graph_style"])
+
+
+def _datetime_parts(day):
+    day = pd.Timestamp(day)
+    return {"year": day.year, "month": day.month, "date": day.day}
+
+
+# st.altair_chart の選択状態から、概観で選択された期間 (開始日, 終了日) を取り出す（未選択の場合はNone）
+# Vega-Liteは日付をUNIX時間（ミリ秒）で返すため、Timestampに変換する
+def selected_window(state):
+    try:
+        values = state["selection"][WINDOW_PARAM]["date"]
+    except (KeyError, TypeError):
+        return None
+    if not values or len(values) != 2:
+        return None
+    start, end = (pd.Timestamp(value, unit="ms") if isinstance(value, (int, float, np.number)) else pd.Timestamp(value)
+                  for value in values)
+    return (start, end) if start < end else (end, start)
@@ -0,0 +1,385 @@
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+# 株価データの取得（プロバイダ）とローカル保存（PriceStore）を担当するモジュール
+
+# 保存する価格カラム（プロバイダによって存在しないカラムは無視する）
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+# ダッシュボードが扱う履歴の開始日（開始年スライダーの最小値に合わせる）
+HISTORY_START = "1990-01-01"
+
+# S&P500と比較できる指数・ETF（ティッカー: 表示名）
+COMPARISON_TICKERS = {
+    "^DJI": "ダウ平均",
+    "^IXIC": "ナスダック総合",
+    "^RUT": "ラッセル2000",
+    "XLK": "テクノロジー",
+    "XLF": "金融",
+    "XLE": "エネルギー",
+    "XLV": "ヘルスケア",
+    "XLY": "一般消費財",
+    "XLP": "生活必需品",
+    "XLI": "資本財",
+    "XLU": "公益事業",
+}
+
+# ローカル保存先（環境変数 SP500_DATA_DIR で上書き可能）
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+
+
+# プロバイダが返したデータを共通の形式（日付インデックス・単一階層のカラム）に揃える
+def normalize_prices(df, ticker):
+    if df is None or df.empty:
+        return pd.DataFrame(columns=PRICE_COLUMNS[:0])
+
+    # yfinanceの新しいバージョンは (Price, Ticker) のMultiIndexカラムを返す
+    if isinstance(df.columns, pd.MultiIndex):
+        if ticker in df.columns.get_level_values(-1):
+            df = df.xs(ticker, axis=1, level=-1)
+        else:
+            df = df.droplevel(-1, axis=1)
+
+    df = df[[column for column in PRICE_COLUMNS if column in df.columns]]
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    df = df.set_axis(index.rename("Date"), axis=0)
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+    # 複数ティッカーの一括取得では他のティッカーの取引日の行が欠損値になるため除く
+    if "Close" in df.columns:
+        df = df[df["Close"].notna()]
+    return df
+
+
+class YFinanceProvider:
+    # Yahoo Finance (yfinance) から日次データを取得するプロバイダ
+    # 価格は配当・分割を調整した値を使う（yfinanceのバージョンによって既定値が異なるため明示する）
+    # 調整により過去の価格が変わった場合は PriceStore が全履歴を取り直す
+    def fetch(self, ticker, start, end=None):
+        df = yf.download(ticker, start=start, end=end, progress=False, auto_adjust=True)
+        return normalize_prices(df, ticker)
+
+    # 複数ティッカーを1回のリクエストでまとめて取得する
+    def fetch_many(self, tickers, start, end=None):
+        df = yf.download(list(tickers), start=start, end=end, progress=False, auto_adjust=True)
+        return {ticker: normalize_prices(df, ticker) for ticker in tickers}
+
+
+# 環境変数 SP500_PRICE_PROVIDER（"module:attr" 形式）で指定されたプロバイダを生成する
+# 未指定の場合は yfinance を使用（テストやオフライン環境ではローカルの偽プロバイダに差し替える）
+def load_provider(spec=None):
+    spec = spec or os.environ.get("SP500_PRICE_PROVIDER")
+    if not spec:
+        return YFinanceProvider()
+    module_name, _, attr = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr or "Provider")
+    return factory() if callable(factory) else factory
+
+
+# データのバージョン文字列（行数・最終日・先頭行と最終行の値のハッシュ）。キャッシュのキーに使用する
+# 更新時は最終日のバーを再取得して上書きし、配当・分割の調整時は過去の価格がすべて変わるため、
+# 行数と最終日が同じでも値が変わることがある
+def data_version(df):
+    if df is None or df.empty:
+        return "empty"
+    first_row, last_row = pd.util.hash_pandas_object(df.iloc[[0, -1]], index=False)
+    return f"{len(df)}-{df.index[-1].strftime('%Y%m%d%H%M%S')}-{first_row:016x}{last_row:016x}"
+
+
+class PriceStore:
+    # ティッカーごとの全履歴をParquetで保存し、更新時は最終日以降の差分だけを取得する
+    def __init__(self, provider, root=None, history_start=HISTORY_START):
+        self.provider = provider
+        self.root = root or os.environ.get("SP500_DATA_DIR", DEFAULT_DATA_DIR)
+        self.history_start = history_start
+        self._lock = threading.Lock()
+
+    def path(self, ticker):
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in ticker)
+        return os.path.join(self.root, f"{safe_name}.parquet")
+
+    # 保存済みのデータを読み込む（存在しない場合はNone）
+    def read(self, ticker):
+        path = self.path(ticker)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)
+
+    def write(self, ticker, df):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(ticker)
+        # 書き込み途中のファイルを読まれないよう、一時ファイル経由で置き換える
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+
+    # 保存済みデータに新しいバーを追記して返す
+    def update(self, ticker):
+        frames, errors = self.update_many([ticker])
+        if ticker in errors:
+            raise errors[ticker]
+        return frames[ticker]
+
+    # 複数ティッカーをまとめて更新する。戻り値は (ティッカーごとのデータ, ティッカーごとの例外)
+    # 取得開始日が同じティッカーは、プロバイダが対応していれば1回の一括取得にまとめ、
+    # 対応していなければスレッドプールで並行して取得する
+    # 取得はロックの外で行い（実行中の更新が他のティッカーの取得を待たせない）、結合と書き込みだけを排他制御する
+    def update_many(self, tickers, max_workers=8):
+        stored = {ticker: (self._signature(ticker), self.read(ticker)) for ticker in tickers}
+        starts = {}
+        for ticker, (_, df) in stored.items():
+            # 最終日の確定前の値を上書きするため最終日を含め、調整の検出のため確定済みの直前の取引日から再取得する
+            start = self.history_start if df is None or df.empty else df.index[max(len(df) - 2, 0)].strftime("%Y-%m-%d")
+            starts.setdefault(start, []).append(ticker)
+
+        fetched, errors = {}, {}
+        for start, group in starts.items():
+            group_fetched, group_errors = self._fetch_group(group, start, max_workers)
+            fetched.update(group_fetched)
+            errors.update(group_errors)
+
+        # 配当・分割の調整で確定済みの価格が変わったティッカーは、保存済みのデータを使わず全履歴を取り直す
+        replaced = [ticker for ticker, df in fetched.items() if self._adjusted(stored[ticker][1], df)]
+        if replaced:
+            group_fetched, group_errors = self._fetch_group(replaced, self.history_start, max_workers)
+            for ticker in group_errors:
+                fetched.pop(ticker, None)
+            fetched.update(group_fetched)
+            errors.update(group_errors)
+
+        frames = {}
+        with self._lock:
+            for ticker in tickers:
+                if ticker in errors:
+                    continue
+                if ticker not in fetched:
+                    errors[ticker] = LookupError(f"{ticker} のデータが取得できませんでした")
+                    continue
+                signature, current = stored[ticker]
+                # 取得中に別の更新が書き込んだ場合は、その内容に結合する
+                if self._signature(ticker) != signature:
+                    current = self.read(ticker)
+                merged = self._merge(None if ticker in replaced else current, fetched[ticker])
+                if merged is not current and not merged.empty:
+                    self.write(ticker, merged)
+                frames[ticker] = merged
+        return frames, errors
+
+    # 保存済みファイルの更新時刻とサイズ（存在しない場合はNone）
+    def _signature(self, ticker):
+        try:
+            stat = os.stat(self.path(ticker))
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _fetch_group(self, tickers, start, max_workers):
+        if len(tickers) > 1 and hasattr(self.provider, "fetch_many"):
+            try:
+                return self.provider.fetch_many(tickers, start=start), {}
+            except Exception as e:
+                return {}, {ticker: e for ticker in tickers}
+
+        fetched, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tickers))) as executor:
+            futures = {ticker: executor.submit(self.provider.fetch, ticker, start=start) for ticker in tickers}
+        for ticker, future in futures.items():
+            try:
+                fetched[ticker] = future.result()
+            except Exception as e:
+                errors[ticker] = e
+        return fetched, errors
+
+    # 確定済みの直前の取引日の終値が保存済みの値と異なる場合は、配当・分割で過去の価格が調整されたとみなす
+    @staticmethod
+    def _adjusted(stored, delta):
+        if stored is None or len(stored) < 2 or "Close" not in delta.columns:
+            return False
+        day = stored.index[-2]
+        if day not in delta.index:
+            return False
+        return not np.isclose(delta.at[day, "Close"], stored["Close"].iloc[-2], rtol=1e-6)
+
+    # 保存済みデータと取得した差分を結合する（変更がない場合は保存済みデータをそのまま返す）
+    @staticmethod
+    def _merge(stored, delta):
+        if stored is None or stored.empty:
+            return delta
+        delta = delta[delta.index >= stored.index[-1]]
+        if delta.empty:
+            return stored
+        merged = pd.concat([stored[stored.index < delta.index[0]], delta])
+        if merged.shape == stored.shape and merged.equals(stored):
+            return stored
+        return merged
+
+
+class TickerCache:
+    # ティッカーごとの読み取り専用データをメモリに保持する（プロセス全体で共有）
+    # 期限切れのデータもそのまま返し（stale-while-revalidate）、更新はバックグラウンドのスレッドで行う
+    # 更新は常に1つだけ実行し、実行中に期限切れを検出した呼び出しは新しい更新を起動しない
+    def __init__(self, store, ttl=3600, retry_interval=60):
+        self.store = store
+        self.ttl = ttl
+        # 更新に失敗したティッカーを再試行するまでの間隔（秒）
+        self.retry_interval = retry_interval
+        self.refreshes = 0
+        # メモリ上のデータを返した数と、読み込みを待った数（ティッカー単位）
+        self.hits = 0
+        self.misses = 0
+        # ティッカー -> (取得時刻（UNIX時間）, データ)
+        self._entries = {}
+        self._errors = {}
+        # ティッカー -> 最後に更新を試みた時刻
+        self._attempted = {}
+        self._refreshing = False
+        self._lock = threading.Lock()
+        # 初回の読み込み（メモリにないティッカー）を直列化する
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._scheduler = None
+
+    # 戻り値は (ティッカーごとのデータ, 直近の更新に失敗したティッカーごとの例外)
+    # メモリにないティッカーだけは、保存済みのデータ（なければプロバイダ）から読み込むまで待つ
+    # 初回の取得に失敗したティッカーも retry_interval が経過するまでは再試行せず、直前の例外を返す
+    def get_many(self, tickers):
+        now = time.time()
+        with self._lock:
+            missing = [ticker for ticker in tickers if ticker not in self._entries]
+            self.hits += len(tickers) - len(missing)
+            self.misses += len(missing)
+            to_load = [ticker for ticker in missing if now - self._attempted.get(ticker, 0) > self.retry_interval]
+        if to_load:
+            self._load(to_load)
+
+        now = time.time()
+        with self._lock:
+            stale = [ticker for ticker in tickers
+                     if ticker in self._entries and now - self._entries[ticker][0] > self.ttl
+                     and now - self._attempted.get(ticker, 0) > self.retry_interval]
+            # 呼び出し元ごとに浅いコピーを返す（配列は共有したまま、列の追加や並べ替えは呼び出し元だけに影響する）
+            frames = {ticker: self._entries[ticker][1].copy(deep=False) for ticker in tickers if ticker in self._entries}
+            errors = {ticker: self._errors[ticker] for ticker in tickers if ticker in self._errors}
+        if stale:
+            self.refresh_async(stale)
+        return frames, errors
+
+    # データを取得した時刻（UNIX時間。未取得の場合はNone）
+    def fetched_at(self, ticker):
+        with self._lock:
+            entry = self._entries.get(ticker)
+        return entry[0] if entry is not None else None
+
+    def _load(self, tickers):
+        with self._load_lock:
+            # 待っている間に他のスレッドが読み込んだ（または取得に失敗した）ティッカーは除く
+            now = time.time()
+            with self._lock:
+                tickers = [ticker for ticker in tickers if ticker not in self._entries
+                           and now - self._attempted.get(ticker, 0) > self.retry_interval]
+            to_fetch = []
+            for ticker in tickers:
+                df = self.store.read(ticker)
+                if df is None or df.empty:
+                    to_fetch.append(ticker)
+                    continue
+                # 保存済みのデータはファイルの更新時刻を取得時刻とする（期限切れならバックグラウンドで更新される）
+                with self._lock:
+                    self._entries[ticker] = (os.path.getmtime(self.store.path(ticker)), freeze_frame(df))
+            if to_fetch:
+                self._update(to_fetch)
+
+    # バックグラウンドのスレッドで更新する（更新中の場合は何もせずFalseを返す）
+    def refresh_async(self, tickers):
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        thread = threading.Thread(target=self._refresh, args=(list(tickers),), name="ticker-refresh", daemon=True)
+        thread.start()
+        return True
+
+    def _refresh(self, tickers):
+        try:
+            self._update(tickers)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _update(self, tickers):
+        try:
+            frames, errors = self.store.update_many(tickers)
+        except Exception as e:
+            frames, errors = {}, {ticker: e for ticker in tickers}
+        now = time.time()
+        with self._lock:
+            self.refreshes += 1
+            for ticker in tickers:
+                self._attempted[ticker] = now
+                df = frames.get(ticker)
+                if df is not None and not df.empty:
+                    self._entries[ticker] = (now, freeze_frame(df))
+                    self._errors.pop(ticker, None)
+                else:
+                    # 取得に失敗した場合は直前のデータを使い続け、次の更新で再試行する
+                    self._errors[ticker] = errors.get(ticker) or LookupError(f"{ticker} のデータが取得できませんでした")
+
+    # ttl ごとにメモリ上の全ティッカーを更新するスレッドを起動する
+    def start(self):
+        with self._lock:
+            if self._scheduler is None:
+                self._scheduler = threading.Thread(target=self._run_scheduler, name="ticker-scheduler", daemon=True)
+                self._scheduler.start()
+        return self
+
+    def _run_scheduler(self):
+        while not self._stop.wait(self.ttl):
+            with self._lock:
+                tickers = list(self._entries)
+            if tickers:
+                self.refresh_async(tickers)
+
+    def stop(self):
+        self._stop.set()
+
+
+# 共有用に読み取り専用のDataFrameを作る（各カラムのNumPy配列を書き込み禁止にする）
+# 値の代入は "assignment destination is read-only" のValueErrorになるが、列の追加・置き換えや
+# inplaceの並べ替えなどDataFrame自体の構造の変更は防げないため、共有する場合は浅いコピーを渡す
+def freeze_frame(df):
+    columns = {}
+    for column in df.columns:
+        values = df[column].to_numpy(copy=True)
+        values.flags.writeable = False
+        columns[column] = values
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+# 全履歴から指定期間を切り出す（二分探索で位置を求め、コピーせずにビューとして返す）
+def slice_range(df, start=None, end=None):
+    index = df.index
+    lo = 0 if start is None else index.searchsorted(pd.Timestamp(start), side="left")
+    hi = len(index) if end is None else index.searchsorted(pd.Timestamp(end), side="right")
+    return df.iloc[lo:hi]
+
+
+# 複数ティッカーの終値を基準の取引日カレンダーに揃える
+# 外部結合したうえで直前の値で埋め、カレンダーの日付だけを取り出す
+def align_to_calendar(frames, calendar):
+    if not frames:
+        return pd.DataFrame(index=calendar)
+    closes = pd.concat({ticker: df["Close"] for ticker, df in frames.items()}, axis=1, sort=True)
+    return closes.ffill().reindex(calendar)
+
+
+# 各系列を最初の有効な値が100になるように指数化する
+def normalize_to_base(closes, base=100.0):
+    return closes / closes.bfill().iloc[0] * base
@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# 描画済みグラフ画像（PNGバイト列）のキャッシュ
+# グラフのパラメータをキーとし、合計バイト数の上限を超えたら最も古く使われたものから破棄する（LRU）
+# 同じキーの描画が実行中の場合は新たに描画せず、その結果を待つ（初回起動時に同じグラフを複数回描画しない）
+
+
+class RenderCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # キー -> 描画中の結果（Future）
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        # 上限より大きい画像はキャッシュしない
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= len(previous)
+            self._entries[key] = image
+            self.total_bytes += len(image)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    # キャッシュになければ render() で生成して保存する
+    # 描画を待った呼び出しは、描画しなかったためヒットとして数える
+    def get_or_render(self, key, render):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return pending.result()
+
+        try:
+            image = render()
+            self.put(key, image)
+            pending.set_result(image)
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+        return image
@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from chart_renderer import render_chart
+
+# グラフ描画を別プロセスで実行するプール
+# Streamlitのスクリプトスレッドは描画仕様（NumPy配列と文字列）を送り、PNGのバイト列を受け取るだけにする
+# 待ち行列が満杯・タイムアウト・ワーカー異常の場合は、呼び出し元のスレッドで描画する
+
+
+class RenderPool:
+    # ワーカーが異常終了した（BrokenProcessPool）場合は、プールを作り直して以降の描画を続ける
+    def __init__(self, workers, max_pending=None, timeout=30.0):
+        self.workers = workers
+        self.max_pending = workers * 2 if max_pending is None else max_pending
+        self.timeout = timeout
+        self.fallbacks = 0
+        self.restarts = 0
+        # プールと実行枠の差し替えを排他制御する
+        self._lock = threading.Lock()
+        self._executor, self._slots = self._create()
+
+    def _create(self):
+        # 実行中と待機中を合わせた上限
+        slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        # Streamlitのサーバはスレッドを多数持つため、forkではなくspawnでワーカーを起動する
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return executor, slots
+
+    # 異常になったプールを新しいプールと実行枠に差し替える（他のスレッドが差し替え済みの場合は何もしない）
+    def _restart(self, broken):
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor, self._slots = self._create()
+            self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def render(self, spec):
+        with self._lock:
+            executor, slots = self._executor, self._slots
+        if not slots.acquire(blocking=False):
+            return self._render_locally(spec)
+        try:
+            future = executor.submit(render_chart, spec)
+        except BrokenProcessPool:
+            slots.release()
+            self._restart(executor)
+            return self._render_locally(spec)
+        except RuntimeError:
+            slots.release()
+            return self._render_locally(spec)
+        # 実行枠は取得したときのものに返す（プールが差し替えられた後も新しい実行枠の数がずれない）
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            return self._render_locally(spec)
+        except BrokenProcessPool:
+            # この描画は呼び出し元で行い、次の描画から新しいプールを使う
+            self._restart(executor)
+            return self._render_locally(spec)
+
+    def _render_locally(self, spec):
+        self.fallbacks += 1
+        return render_chart(spec)
+
+    def shutdown(self):
+        with self._lock:
+            executor = self._executor
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 環境変数から描画プールを生成する（RENDER_WORKERS が0または未指定の場合はプールを使わずNone）
+def create_render_pool():
+    workers = int(os.environ.get("RENDER_WORKERS", "0"))
+    if workers <= 0:
+        return None
+    max_pending = os.environ.get("RENDER_QUEUE_SIZE")
+    return RenderPool(
+        workers,
+        max_pending=int(max_pending) if max_pending else None,
+        timeout=float(os.environ.get("RENDER_TIMEOUT", "30")),
+    )